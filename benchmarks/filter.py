@@ -0,0 +1,135 @@
+#
+# filter.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import labelplus.core.core
+
+
+#
+# Benchmark for the two label filter strategies
+#
+# Times Core._filter_by_label scanning every torrent against walking label
+# membership, over a range of selectivities. Selectivity is the share of the
+# library in the requested label. Deluge passes either every torrent or only
+# those left by other filters, so both cases are measured. The ratio column
+# is label members over input torrents, the quantity FILTER_INDEX_RATIO is
+# compared against, and the speedup column is scan time over index time.
+#
+# Usage: python benchmarks/filter.py [num_torrents]
+#
+
+LABEL_IN = "0"
+LABEL_OUT = "1"
+
+SELECTIVITIES = (0.001, 0.01, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0)
+SUBSETS = (1.0, 0.5, 0.2)
+DEFAULT_NUM_TORRENTS = 50000
+
+STRATEGY_SCAN = 0.0
+STRATEGY_INDEX = float("inf")
+
+
+def make_core(num_torrents, selectivity):
+
+  core = labelplus.core.core.Core.__new__(labelplus.core.core.Core)
+
+  torrent_ids = ["%040x" % x for x in xrange(num_torrents)]
+  num_in = int(num_torrents*selectivity)
+
+  core._torrents = dict.fromkeys(torrent_ids)
+  core._labels = {LABEL_IN: {}, LABEL_OUT: {}}
+  core._mappings = {}
+
+  # Spread members over the library as a real label would be
+  for i, id in enumerate(torrent_ids):
+    if i*num_in/num_torrents != (i+1)*num_in/num_torrents:
+      core._mappings[id] = LABEL_IN
+    else:
+      core._mappings[id] = LABEL_OUT
+
+  core._build_label_index()
+  core._build_unlabeled_index()
+
+  return core, torrent_ids
+
+
+def time_filter(core, torrent_ids, strategy):
+
+  labelplus.core.core.FILTER_INDEX_RATIO = strategy
+
+  timer = timeit.Timer(lambda: core._filter_by_label(torrent_ids, [LABEL_IN]))
+  number = 10
+
+  return min(timer.repeat(5, number)) / number
+
+
+def main():
+
+  if len(sys.argv) > 1:
+    num_torrents = int(sys.argv[1])
+  else:
+    num_torrents = DEFAULT_NUM_TORRENTS
+
+  ratio = labelplus.core.core.FILTER_INDEX_RATIO
+
+  print "%8s %8s %8s %10s %10s %8s" % ("input", "select", "ratio",
+    "scan (ms)", "index (ms)", "speedup")
+
+  try:
+    for subset in SUBSETS:
+      for selectivity in SELECTIVITIES:
+        core, torrent_ids = make_core(num_torrents, selectivity)
+        torrent_ids = torrent_ids[:int(len(torrent_ids)*subset)]
+
+        scan = time_filter(core, torrent_ids, STRATEGY_SCAN)
+        index = time_filter(core, torrent_ids, STRATEGY_INDEX)
+
+        members = len(core._index[LABEL_IN]["torrents"])
+
+        print "%8d %8.3f %8.3f %10.2f %10.2f %8.2f" % (len(torrent_ids),
+          selectivity, float(members)/len(torrent_ids), scan*1000,
+          index*1000, scan/index)
+  finally:
+    labelplus.core.core.FILTER_INDEX_RATIO = ratio
+
+
+if __name__ == "__main__":
+  main()
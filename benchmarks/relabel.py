@@ -0,0 +1,121 @@
+#
+# relabel.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import labelplus.common
+import labelplus.core.core
+import labelplus.core.mapping_store
+
+
+#
+# Micro-benchmark for relabeling torrents between two labels
+#
+# Drives Core._set_torrent_label on a Core holding only the state it touches,
+# so the plugin's dependencies must be importable but no daemon is needed.
+# Time per torrent should stay flat as the number of torrents grows.
+#
+# Usage: python benchmarks/relabel.py [max_torrents]
+#
+
+LABEL_A = "0"
+LABEL_B = "1"
+
+STEPS = 4
+DEFAULT_MAX_TORRENTS = 50000
+
+
+def make_core(num_torrents):
+
+  core = labelplus.core.core.Core.__new__(labelplus.core.core.Core)
+
+  core._torrents = dict(("%040x" % x, None) for x in xrange(num_torrents))
+  core._labels = {LABEL_A: {}, LABEL_B: {}}
+  core._mappings = dict.fromkeys(core._torrents, LABEL_A)
+  core._prefs = {"options": {"reset_on_label_unset": False}}
+  core._mapping_store = labelplus.core.mapping_store.MappingStore(
+    os.devnull, None)
+  core._change_journal = collections.OrderedDict()
+  core._timestamp = {"journal_trimmed": labelplus.common.DATETIME_010101}
+
+  # Only the label bookkeeping is measured, not libtorrent
+  core._apply_torrent_options = lambda torrent_id: None
+
+  core._build_label_index()
+  core._build_unlabeled_index()
+
+  return core
+
+
+def relabel(core, label_id):
+
+  start = time.time()
+
+  for torrent_id in core._torrents.keys():
+    core._set_torrent_label(torrent_id, label_id)
+
+  return time.time() - start
+
+
+def main():
+
+  if len(sys.argv) > 1:
+    max_torrents = int(sys.argv[1])
+  else:
+    max_torrents = DEFAULT_MAX_TORRENTS
+
+  print "%10s %12s %16s" % ("torrents", "total (s)", "per torrent (us)")
+
+  for step in range(1, STEPS+1):
+    num_torrents = max_torrents*step/STEPS
+    core = make_core(num_torrents)
+
+    elapsed = min(relabel(core, LABEL_B), relabel(core, LABEL_A))
+
+    assert len(core._index[LABEL_A]["torrents"]) == num_torrents
+    assert not core._index[LABEL_B]["torrents"]
+
+    print "%10d %12.3f %16.2f" % (num_torrents, elapsed,
+      elapsed/num_torrents*1000000)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,262 @@
+#
+# shared_limit.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import copy
+import os
+import random
+import sys
+
+import twisted.internet.reactor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import labelplus.common.config
+import labelplus.core.core
+
+
+#
+# Check and benchmark for shared limit hysteresis
+#
+# Runs Core._shared_limit_update_loop on a Core holding only the state it
+# touches, over torrents whose rates churn between rounds: most drift a
+# little, some jump and some pause or resume. Every push the loop makes is
+# checked against the applied and suppressed counters, then the share of
+# suppressed pushes is reported.
+#
+# Usage: python benchmarks/shared_limit.py [rounds] [hysteresis]
+#
+
+ROOT_ID = "0"
+SUBLABEL_ID = "0:0"
+
+NUM_TORRENTS = 200
+DEFAULT_ROUNDS = 100
+
+DRIFT = 0.02
+JUMP_CHANCE = 0.1
+PAUSE_CHANCE = 0.05
+
+
+class Status(object):
+
+  def __init__(self):
+
+    self.download_payload_rate = 0.0
+    self.upload_payload_rate = 0.0
+
+
+class Handle(object):
+
+  def __init__(self):
+
+    self._status = Status()
+
+
+  def status(self):
+
+    return self._status
+
+
+class Torrent(object):
+
+  def __init__(self, log):
+
+    self.state = "Downloading"
+    self.handle = Handle()
+
+    self._log = log
+
+
+  def set_max_download_speed(self, limit):
+
+    self._log.append((self, "max_download_speed", limit))
+
+
+  def set_max_upload_speed(self, limit):
+
+    self._log.append((self, "max_upload_speed", limit))
+
+
+def make_core(hysteresis, log):
+
+  core = labelplus.core.core.Core.__new__(labelplus.core.core.Core)
+
+  options = copy.deepcopy(labelplus.common.config.LABEL_DEFAULTS)
+  options["bandwidth_settings"] = True
+  options["shared_limit"] = True
+  options["max_download_speed"] = 500.0
+  options["max_upload_speed"] = 200.0
+
+  core._initialized = True
+  core._core = {
+    "max_download_speed_per_torrent": -1.0,
+    "max_upload_speed_per_torrent": -1.0,
+  }
+  core._prefs = {
+    "options": {
+      "shared_limit_interval": 1,
+      "shared_limit_hysteresis": hysteresis,
+    },
+  }
+
+  core._torrents = dict(("%040x" % x, Torrent(log))
+    for x in xrange(NUM_TORRENTS))
+  core._labels = {
+    ROOT_ID: {"options": options},
+    SUBLABEL_ID: {"options":
+      copy.deepcopy(labelplus.common.config.LABEL_DEFAULTS)},
+  }
+  core._mappings = dict((x, random.choice((ROOT_ID, SUBLABEL_ID)))
+    for x in core._torrents)
+
+  core._shared_limit_index = set([ROOT_ID])
+  core._shared_limit_schedule = {}
+  core._applied_limits = {}
+  core._shared_limit_stats = {
+    "applied": 0,
+    "suppressed": 0,
+  }
+
+  core._build_label_index()
+
+  for torrent in core._torrents.itervalues():
+    status = torrent.handle.status()
+    status.download_payload_rate = random.uniform(0, 20*1024)
+    status.upload_payload_rate = random.uniform(0, 10*1024)
+
+  return core
+
+
+def churn(core):
+
+  for torrent in core._torrents.itervalues():
+    if random.random() < PAUSE_CHANCE:
+      if torrent.state == "Paused":
+        torrent.state = "Downloading"
+      else:
+        torrent.state = "Paused"
+
+    status = torrent.handle.status()
+
+    if random.random() < JUMP_CHANCE:
+      status.download_payload_rate = random.uniform(0, 20*1024)
+      status.upload_payload_rate = random.uniform(0, 10*1024)
+    else:
+      status.download_payload_rate *= random.uniform(1-DRIFT, 1+DRIFT)
+      status.upload_payload_rate *= random.uniform(1-DRIFT, 1+DRIFT)
+
+
+def check_round(core, log):
+
+  def apply_shared_limit(torrent_id, key, limit):
+
+    torrent = core._torrents[torrent_id]
+    last = core._applied_limits.get(torrent_id, {}).get(key)
+    stats = dict(core._shared_limit_stats)
+    pushes = len(log)
+
+    apply_orig(torrent_id, key, limit)
+
+    applied = core._shared_limit_stats["applied"] - stats["applied"]
+    suppressed = core._shared_limit_stats["suppressed"] - stats["suppressed"]
+
+    if len(log) > pushes:
+      assert log[pushes:] == [(torrent, key, limit)]
+      assert (applied, suppressed) == (1, 0)
+    else:
+      threshold = core._prefs["options"]["shared_limit_hysteresis"]
+      assert last is not None
+      assert abs(limit-last) <= threshold*max(limit, last)
+      assert (applied, suppressed) == (0, 1)
+
+    calls[0] += 1
+
+
+  apply_orig = core._apply_shared_limit
+  core._apply_shared_limit = apply_shared_limit
+
+  calls = [0]
+  stats = dict(core._shared_limit_stats)
+  pushes = len(log)
+
+  # Make every tree due, whatever its backoff
+  core._shared_limit_schedule.clear()
+  core._shared_limit_update_loop()
+
+  # The loop reschedules itself, but rounds are driven from here
+  for call in twisted.internet.reactor.getDelayedCalls():
+    call.cancel()
+
+  del core._apply_shared_limit
+
+  applied = core._shared_limit_stats["applied"] - stats["applied"]
+  suppressed = core._shared_limit_stats["suppressed"] - stats["suppressed"]
+
+  assert applied == len(log) - pushes
+  assert applied + suppressed == calls[0]
+
+
+def main():
+
+  rounds = DEFAULT_ROUNDS
+  hysteresis = labelplus.common.config.OPTION_DEFAULTS[
+    "shared_limit_hysteresis"]
+
+  if len(sys.argv) > 1:
+    rounds = int(sys.argv[1])
+  if len(sys.argv) > 2:
+    hysteresis = float(sys.argv[2])
+
+  random.seed(0)
+
+  log = []
+  core = make_core(hysteresis, log)
+
+  for i in xrange(rounds):
+    check_round(core, log)
+    churn(core)
+
+  stats = core._shared_limit_stats
+  total = stats["applied"] + stats["suppressed"]
+
+  print "rounds: %d, hysteresis: %.3f" % (rounds, hysteresis)
+  print "applied: %d, suppressed: %d (%.1f%%)" % (stats["applied"],
+    stats["suppressed"], 100.0*stats["suppressed"]/max(total, 1))
+  print "setter calls: %d" % len(log)
+
+
+if __name__ == "__main__":
+  main()
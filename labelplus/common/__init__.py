@@ -51,6 +51,8 @@ DISPLAY_NAME = _("LabelPlus")
 STATUS_ID = "%s_id" % MODULE_NAME
 STATUS_NAME = "%s_name" % MODULE_NAME
 
+FILTER_TREE_ID = "%s_tree_id" % MODULE_NAME
+
 DATETIME_010101 = datetime.datetime(1, 1, 1)
 
 
@@ -67,6 +69,7 @@ def get_resource(filename):
 class LabelUpdate(object):
 
   TYPE_FULL = "Full"
+  TYPE_DELTA = "Delta"
 
 
   def __init__(self, type_, timestamp, data):
@@ -151,10 +151,25 @@ CONFIG_DEFAULTS_V3 = {
   "mappings": {}, # "torrent_id": "label_id"
 }
 
-CONFIG_VERSION = 3
-OPTION_DEFAULTS = OPTION_DEFAULTS_V3
+OPTION_DEFAULTS_V4 = {
+  "autolabel_batch_size": 100,
+  "shared_limit_hysteresis": 0.05,
+}
+OPTION_DEFAULTS_V4.update(OPTION_DEFAULTS_V3)
+
+CONFIG_DEFAULTS_V4 = {
+  "prefs": {
+    "options": OPTION_DEFAULTS_V4,
+    "label": LABEL_DEFAULTS_V3,
+  },
+  "labels": {},   # "label_id": {"name": str, "data": dict}
+  "mappings": {}, # "torrent_id": "label_id"
+}
+
+CONFIG_VERSION = 4
+OPTION_DEFAULTS = OPTION_DEFAULTS_V4
 LABEL_DEFAULTS = LABEL_DEFAULTS_V3
-CONFIG_DEFAULTS = CONFIG_DEFAULTS_V3
+CONFIG_DEFAULTS = CONFIG_DEFAULTS_V4
 
 
 def get_version(config):
@@ -89,6 +89,39 @@ OP_FUNCS = {
     lambda x,y,z: all(OP_FUNCS[OP_CONTAINS](x, s, z) for s in y.split()),
 }
 
+OP_PATTERNS = {
+  OP_CONTAINS: lambda y: re.escape(y),
+  OP_DOESNT_CONTAIN: lambda y: OP_PATTERNS[OP_CONTAINS](y),
+  OP_IS: lambda y: '^' + re.escape(y) + '$',
+  OP_IS_NOT: lambda y: OP_PATTERNS[OP_IS](y),
+  OP_STARTS_WITH: lambda y: '^' + re.escape(y),
+  OP_ENDS_WITH: lambda y: re.escape(y) + '$',
+  OP_MATCHES_REGEX: lambda y: y,
+}
+
+NEGATED_OPS = (OP_DOESNT_CONTAIN, OP_IS_NOT)
+
+# Ops that can be answered from a combined literal scan, mapped to the
+# positive op whose hits they are evaluated against
+COMBINED_OPS = {
+  OP_CONTAINS: OP_CONTAINS,
+  OP_DOESNT_CONTAIN: OP_CONTAINS,
+  OP_IS: OP_IS,
+  OP_IS_NOT: OP_IS,
+  OP_STARTS_WITH: OP_STARTS_WITH,
+  OP_ENDS_WITH: OP_ENDS_WITH,
+  OP_CONTAINS_WORDS: OP_CONTAINS_WORDS,
+}
+
+COMBINED_PROPS = (PROP_NAME, PROP_TRACKER, PROP_FILES)
+
+# Matches any character outside ASCII, in both str and unicode values
+NON_ASCII = re.compile("[^\x00-\x7f]").search
+
+PLAN_HIT = 0
+PLAN_WORDS = 1
+PLAN_FUNC = 2
+
 FIELD_PROP = 0
 FIELD_OP = 1
 FIELD_CASE = 2
@@ -105,38 +138,253 @@ NUM_FIELDS = 4
 # rules format: [[property, op, case, query],]
 #
 
+def compile_rule(rule, use_unicode=True):
+
+  prop, op, case, query = rule
+
+  flags = re.UNICODE if use_unicode else 0
+
+  if case == CASE_IGNORE:
+    flags |= re.IGNORECASE
+
+  if op == OP_CONTAINS_WORDS:
+    searches = [re.compile(re.escape(s), flags).search for s in query.split()]
+    func = lambda x: all(search(x) for search in searches)
+  else:
+    func = re.compile(OP_PATTERNS[op](query), flags).search
+
+  return (prop, func, op in NEGATED_OPS)
+
+
+class RuleSet(object):
+
+  def __init__(self, rules, match_all=False, use_unicode=True):
+
+    self.rules = list(rules)
+    self.match_all = match_all
+    self.props = set()
+
+    self._rules = []
+
+    for rule in self.rules:
+      self._rules.append(compile_rule(rule, use_unicode))
+      self.props.add(rule[FIELD_PROP])
+
+
+  def match(self, props):
+
+    if not self._rules:
+      return False
+
+    for prop, func, negate in self._rules:
+      values = props.get(prop) or []
+
+      has_match = False
+
+      for value in values:
+        if func(value):
+          has_match = True
+          break
+
+      if negate:
+        has_match = not has_match
+
+      if self.match_all and not has_match:
+        return False
+
+      if not self.match_all and has_match:
+        return True
+
+    return self.match_all
+
+
 def find_match(props, rules, match_all=False, use_unicode=True):
 
-  if not rules:
-    return False
+  return RuleSet(rules, match_all, use_unicode).match(props)
+
+
+#
+# Evaluates several rule sets against the same props, returning the key of
+# the first one that matches. Literal rules on name, tracker and file props
+# are answered from one regex scan per (property, case) pair; other rules are
+# evaluated individually.
+#
+# Outside ASCII, ignore case matching has special cases that lower() does not
+# reproduce, such as final sigma and dotless i. Such queries are evaluated
+# individually, and hits in such values are confirmed with the regex engine.
+#
+
+class CombinedRuleSet(object):
+
+  def __init__(self, rulesets):
+
+    self.props = set()
+
+    self._plans = []
+    self._queries = {}
 
-  for rule in rules:
-    values = props.get(rule[FIELD_PROP]) or []
-    op = rule[FIELD_OP]
-    op_func = OP_FUNCS[op]
-    negate = op in [OP_DOESNT_CONTAIN, OP_IS_NOT]
+    for key, ruleset in rulesets:
+      plan = [self._plan_rule(x) for x in ruleset.rules]
+      self._plans.append((key, ruleset.match_all, plan))
+      self.props.update(ruleset.props)
 
-    flags = re.UNICODE if use_unicode else 0
+    self._scanners = {}
 
-    if rule[FIELD_CASE] == CASE_IGNORE:
+    for group in self._queries:
+      self._scanners[group] = self._build_scanner(group)
+
+
+  def _plan_rule(self, rule):
+
+    prop, op, case, query = rule
+    negate = op in NEGATED_OPS
+
+    if (prop in COMBINED_PROPS and op in COMBINED_OPS and
+        not (case == CASE_IGNORE and NON_ASCII(query))):
+      if case == CASE_IGNORE:
+        query = query.lower()
+
+      if op == OP_CONTAINS_WORDS:
+        words = query.split()
+      else:
+        words = [query]
+
+      # A query of only whitespace always matches, as in RuleSet
+      if words and all(words):
+        group = (prop, case)
+        queries, need_words = self._queries.get(group, (set(), False))
+        queries.update(words)
+
+        if op == OP_CONTAINS_WORDS and len(words) > 1:
+          self._queries[group] = (queries, True)
+          return (prop, PLAN_WORDS, (group, frozenset(words)), negate)
+
+        self._queries[group] = (queries, need_words)
+
+        op = COMBINED_OPS[op]
+        if op == OP_CONTAINS_WORDS:
+          op = OP_CONTAINS
+
+        return (prop, PLAN_HIT, (op, prop, case, words[0]), negate)
+
+    prop, func, negate = compile_rule(rule)
+    return (prop, PLAN_FUNC, func, negate)
+
+
+  def _build_scanner(self, group):
+
+    prop, case = group
+    queries, need_words = self._queries[group]
+
+    flags = re.UNICODE
+    if case == CASE_IGNORE:
       flags |= re.IGNORECASE
 
-    query = rule[FIELD_QUERY]
+    # Longest first, so the alternation yields the longest query at each
+    # position; every other query matching there is a prefix of it
+    alternatives = sorted(queries, key=len, reverse=True)
+    regex = re.compile("(?=(%s))" %
+      "|".join(re.escape(x) for x in alternatives), flags)
+
+    closure = {}
+    for query in queries:
+      closure[query] = [query[:i] for i in range(1, len(query)+1)
+        if query[:i] in queries]
+
+    matchers = []
+    if case == CASE_IGNORE:
+      matchers = [(x, re.compile(re.escape(x), flags).match) for x in queries]
+
+    return (regex, closure, matchers, need_words)
+
+
+  def _find_hits(self, props):
+
+    hits = set()
+    value_hits = {}
 
-    has_match = False
+    for group in self._scanners:
+      prop, case = group
+      regex, closure, matchers, need_words = self._scanners[group]
 
-    for value in values:
-      if op_func(value, query, flags):
-        has_match = True
-        break
+      values = props.get(prop) or []
+      group_hits = []
 
-    if negate:
-      has_match = not has_match
+      for value in values:
+        found = set()
+        length = len(value)
+        confirm = matchers and NON_ASCII(value)
 
-    if match_all and not has_match:
+        for match in regex.finditer(value):
+          start = match.start()
+          text = match.group(1)
+
+          if confirm:
+            queries = [x for x, func in matchers
+              if len(x) <= len(text) and func(value, start)]
+          elif case == CASE_IGNORE:
+            queries = closure.get(text.lower(), ())
+          else:
+            queries = closure.get(text, ())
+
+          for query in queries:
+            end = start + len(query)
+            at_end = (end == length or
+              (end == length-1 and value[-1] == "\n"))
+
+            hits.add((OP_CONTAINS, prop, case, query))
+
+            if start == 0:
+              hits.add((OP_STARTS_WITH, prop, case, query))
+              if at_end:
+                hits.add((OP_IS, prop, case, query))
+
+            if at_end:
+              hits.add((OP_ENDS_WITH, prop, case, query))
+
+            if need_words:
+              found.add(query)
+
+        if need_words:
+          group_hits.append(found)
+
+      value_hits[group] = group_hits
+
+    return hits, value_hits
+
+
+  def _match_plan(self, plan, match_all, props, hits, value_hits):
+
+    if not plan:
       return False
 
-    if not match_all and has_match:
-      return True
+    for prop, type_, data, negate in plan:
+      if type_ == PLAN_HIT:
+        has_match = data in hits
+      elif type_ == PLAN_WORDS:
+        group, words = data
+        has_match = any(words <= x for x in value_hits[group])
+      else:
+        has_match = any(data(x) for x in props.get(prop) or [])
+
+      if negate:
+        has_match = not has_match
+
+      if match_all and not has_match:
+        return False
+
+      if not match_all and has_match:
+        return True
+
+    return match_all
+
+
+  def match(self, props):
+
+    hits, value_hits = self._find_hits(props)
+
+    for key, match_all, plan in self._plans:
+      if self._match_plan(plan, match_all, props, hits, value_hits):
+        return key
 
-  return match_all
+    return None
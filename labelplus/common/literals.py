@@ -42,6 +42,7 @@ TITLE_SELECT_FOLDER = "Select A Folder"
 
 TITLE_SET_FILTER = "Set Filter"
 TITLE_SET_LABEL = "Set Label"
+TITLE_FIND_LABEL = "Find Label"
 
 TITLE_USER_INTERFACE = "User Interface"
 TITLE_LABEL_DEFAULTS = "Label Defaults"
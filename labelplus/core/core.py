@@ -35,10 +35,14 @@
 
 
 import cPickle
+import collections
 import copy
 import datetime
+import heapq
 import logging
 import os
+import re
+import time
 
 import twisted.internet
 
@@ -46,6 +50,7 @@ import deluge.common
 import deluge.component
 import deluge.configmanager
 import deluge.core.rpcserver
+import deluge.event
 
 import labelplus.common
 import labelplus.common.config
@@ -55,6 +60,9 @@ import labelplus.common.label
 
 import labelplus.core.config
 import labelplus.core.config.convert
+import labelplus.core.journal
+import labelplus.core.mapping_store
+import labelplus.core.shared_limit
 
 
 from deluge.plugins.pluginbase import CorePluginBase
@@ -70,8 +78,55 @@ from labelplus.common.literals import (
 
 CORE_CONFIG = "%s.conf" % labelplus.common.MODULE_NAME
 DELUGE_CORE_CONFIG = "core.conf"
+MAPPINGS_STORE = "%s.mappings" % labelplus.common.MODULE_NAME
+LABELS_JOURNAL = "%s.labels.journal" % labelplus.common.MODULE_NAME
 
 CONFIG_SAVE_INTERVAL = 60*2
+JOURNAL_SYNC_DELAY = 1
+
+CHANGE_JOURNAL_SIZE = 1000
+CHANGE_NOTIFY_DELAY = 0.5
+
+ACTIVE_STATES = ("Seeding", "Downloading")
+
+# Measured with benchmarks/filter.py
+FILTER_INDEX_RATIO = 1.0
+
+OPTION_GROUPS = {
+  "download_settings": ("move_completed", "move_completed_path",
+    "prioritize_first_last"),
+  "bandwidth_settings": ("max_download_speed", "max_upload_speed",
+    "max_connections", "max_upload_slots", "shared_limit"),
+  "queue_settings": ("auto_managed", "stop_at_ratio", "stop_ratio",
+    "remove_at_ratio"),
+}
+
+# Torrent option changed by each setter, used to skip redundant calls
+SETTER_OPTIONS = {
+  "set_move_completed": "move_completed",
+  "set_move_completed_path": "move_completed_path",
+  "set_prioritize_first_last": "prioritize_first_last_pieces",
+  "set_max_download_speed": "max_download_speed",
+  "set_max_upload_speed": "max_upload_speed",
+  "set_max_connections": "max_connections",
+  "set_max_upload_slots": "max_upload_slots",
+  "set_auto_managed": "auto_managed",
+  "set_stop_at_ratio": "stop_at_ratio",
+  "set_stop_ratio": "stop_ratio",
+  "set_remove_at_ratio": "remove_at_ratio",
+}
+
+OPTION_SYNC_BATCH_SIZE = 200
+
+SHARED_LIMIT_TICK = 1
+SHARED_LIMIT_MIN_INTERVAL = 1
+SHARED_LIMIT_MAX_BACKOFF = 8
+SHARED_LIMIT_STABLE_RATIO = 0.1
+
+SHARED_LIMIT_FIELDS = (
+  ("max_download_speed", "download_payload_rate"),
+  ("max_upload_speed", "upload_payload_rate"),
+)
 
 
 log = logging.getLogger(__name__)
@@ -85,6 +140,14 @@ def cmp_length_then_value(x, y):
   return cmp(x, y)
 
 
+def get_id_number(label_id):
+
+  try:
+    return int(label_id.rpartition(":")[2])
+  except ValueError:
+    return None
+
+
 def check_init(func):
 
   def wrap(*args, **kwargs):
@@ -99,6 +162,13 @@ def check_init(func):
   return wrap
 
 
+class LabelPlusChangedEvent(deluge.event.DelugeEvent):
+
+  def __init__(self, cursor):
+
+    self._args = [cursor]
+
+
 class Core(CorePluginBase):
 
   # Section: Initialization
@@ -109,6 +179,15 @@ class Core(CorePluginBase):
 
     self._initialized = False
     self._config = None
+    self._mapping_store = None
+    self._label_journal = None
+    self._write_queue = None
+    self._dirty_labels = set()
+    self._config_dirty = False
+    self._notify_call = None
+    self._journal_call = None
+    self._autolabel_job = None
+    self._option_sync_job = None
 
 
   def enable(self):
@@ -137,7 +216,14 @@ class Core(CorePluginBase):
       self._orig_set_torrent(torrent_id, label_id)
       target_label_id = self._find_autolabel_match(torrent_id)
       if target_label_id != labelplus.common.label.ID_NONE:
-        self._do_autolabel_torrent(torrent_id)
+        self._do_autolabel_torrent(torrent_id, target_label_id)
+
+
+    def run_timed(name, func):
+
+      start = time.time()
+      func()
+      timings.append("%s: %.3fs" % (name, time.time()-start))
 
 
     self._orig_set_torrent = None
@@ -153,31 +239,53 @@ class Core(CorePluginBase):
 
     self._prefs = self._config["prefs"]
     self._labels = self._config["labels"]
-    self._mappings = self._config["mappings"]
+    self._mappings = self._mapping_store.data
 
     self._sorted_labels = {}
+    self._shared_limit_index = set()
+    self._unlabeled_index = set()
+    self._applied_limits = {}
+    self._shared_limit_schedule = {}
+    self._shared_limit_stats = {
+      "applied": 0,
+      "suppressed": 0,
+    }
+
+    self._autolabel_index = {}
+    self._autolabel_matcher = None
 
     self._timestamp = {
       "labels_changed": labelplus.common.DATETIME_010101,
       "mappings_changed": labelplus.common.DATETIME_010101,
       "labels_sorted": labelplus.common.DATETIME_010101,
       "last_saved": labelplus.common.DATETIME_010101,
+      "journal_trimmed": datetime.datetime.now(),
     }
 
+    self._change_journal = collections.OrderedDict()
+
     self._torrents = deluge.component.get("TorrentManager").torrents
 
-    self._build_label_index()
-    self._remove_orphans()
+    timings = []
 
-    self._normalize_data()
-    self._normalize_mappings()
-    self._normalize_path_modes()
+    run_timed("index", self._build_label_index)
+    run_timed("orphans", self._remove_orphans)
 
-    self._build_fullname_index()
-    self._build_shared_limit_index()
+    run_timed("data", self._normalize_data)
+    run_timed("mappings", self._normalize_mappings)
+    run_timed("unlabeled", self._build_unlabeled_index)
+    run_timed("path modes", self._normalize_path_modes)
+
+    run_timed("fullname", self._build_fullname_index)
+    run_timed("shared limit", self._build_shared_limit_index)
+    run_timed("autolabel", self._build_autolabel_index)
+
+    log.debug("Initialization timings: %s", ", ".join(timings))
 
     deluge.component.get("FilterManager").register_filter(
       labelplus.common.STATUS_ID, self.filter_by_label)
+    deluge.component.get("FilterManager").register_filter(
+      labelplus.common.FILTER_TREE_ID, self.filter_by_label_tree)
 
     deluge.component.get("CorePluginManager").register_status_field(
       labelplus.common.STATUS_NAME, self.get_torrent_label_name)
@@ -226,45 +334,90 @@ class Core(CorePluginBase):
       log.debug("Config file converted: v%s -> v%s",
         old_ver, labelplus.common.config.CONFIG_VERSION)
 
-    labelplus.core.config.remove_invalid_keys(config.config)
+    self._write_queue = labelplus.core.journal.WriteQueue()
+    self._dirty_labels = set()
+    self._config_dirty = False
 
-    return config
+    self._label_journal = labelplus.core.journal.Journal(
+      deluge.configmanager.get_config_dir(LABELS_JOURNAL))
 
+    generation, records = self._label_journal.read()
 
-  def _build_label_index(self):
+    if records:
+      log.debug("Replaying %s label changes from journal", len(records))
 
-    def build_label_entry(label_id):
+      for id, data in records:
+        if data is None:
+          config["labels"].pop(id, None)
+        else:
+          config["labels"][id] = data
 
-      children = []
-      torrents = []
+    labelplus.core.config.remove_invalid_keys(config.config)
 
-      for id in self._labels:
-        if id == label_id:
-          continue
+    if records:
+      config.save()
 
-        if labelplus.common.label.get_parent_id(id) == label_id:
-          children.append(id)
+    if records or generation is None:
+      self._label_journal.reset(0)
 
-      for id in self._mappings:
-        if self._mappings[id] == label_id:
-          torrents.append(id)
+    self._mapping_store = labelplus.core.mapping_store.MappingStore(
+      deluge.configmanager.get_config_dir(MAPPINGS_STORE), self._write_queue)
+    self._mapping_store.load()
 
-      label_entry = {
-        "children": children,
-        "torrents": torrents,
-      }
+    if config["mappings"]:
+      log.debug("Moving %s mappings out of config file",
+        len(config["mappings"]))
+      self._mapping_store.import_data(config["mappings"])
+      config["mappings"] = {}
+      config.save()
+
+    return config
 
-      return label_entry
 
+  def _build_label_index(self):
 
     index = {}
 
-    index[labelplus.common.label.ID_NULL] = build_label_entry(
-      labelplus.common.label.ID_NULL)
+    index[labelplus.common.label.ID_NULL] = {
+      "children": [],
+      "next_id": 0,
+      "free_ids": [],
+      "torrents": set(),
+    }
 
     for id in self._labels:
       if id not in labelplus.common.label.RESERVED_IDS:
-        index[id] = build_label_entry(id)
+        index[id] = {
+          "children": [],
+          "next_id": 0,
+          "free_ids": [],
+          "torrents": set(),
+        }
+
+    for id in self._labels:
+      if id in labelplus.common.label.RESERVED_IDS:
+        continue
+
+      parent_id = labelplus.common.label.get_parent_id(id)
+      if parent_id in index:
+        index[parent_id]["children"].append(id)
+
+    for id, label_id in self._mappings.iteritems():
+      if label_id in index:
+        index[label_id]["torrents"].add(id)
+
+    for entry in index.itervalues():
+      used = set()
+
+      for id in entry["children"]:
+        num = get_id_number(id)
+        if num is not None:
+          used.add(num)
+
+      if used:
+        entry["next_id"] = max(used) + 1
+        entry["free_ids"] = [x for x in xrange(entry["next_id"])
+          if x not in used]
 
     self._index = index
 
@@ -299,16 +452,27 @@ class Core(CorePluginBase):
 
   def _normalize_mappings(self):
 
+    torrent_ids = []
+
     for id in self._mappings.keys():
       if id in self._torrents:
         if self._mappings[id] in self._labels:
-          self._apply_torrent_options(id)
+          torrent_ids.append(id)
           continue
         elif self._prefs["options"]["reset_on_label_unset"]:
           self._reset_torrent_options(id)
 
       self._remove_torrent_label(id)
 
+    # Options are reapplied in the background so startup is not held up
+    self._start_option_sync_job(torrent_ids)
+
+
+  def _build_unlabeled_index(self):
+
+    self._unlabeled_index = set(x for x in self._torrents
+      if x not in self._mappings)
+
 
   def _normalize_path_modes(self):
 
@@ -321,16 +485,24 @@ class Core(CorePluginBase):
 
   def _build_shared_limit_index(self):
 
-    shared_limit_index = []
+    shared_limit_index = set()
 
     for id in self._labels:
       if (self._labels[id]["options"]["bandwidth_settings"] and
           self._labels[id]["options"]["shared_limit"]):
-        shared_limit_index.append(id)
+        shared_limit_index.add(id)
 
     self._shared_limit_index = shared_limit_index
 
 
+  def _build_autolabel_index(self):
+
+    self._autolabel_index = {}
+
+    for id in self._labels:
+      self._update_autolabel_index(id)
+
+
   # Section: Deinitialization
 
   def disable(self):
@@ -342,12 +514,28 @@ class Core(CorePluginBase):
 
     if self._config:
       if self._initialized:
-        self._config.save()
+        self._mapping_store.flush()
+
+        try:
+          self._save_config(wait=True)
+        except Exception as e:
+          log.error("Unable to save config: %s", e)
 
       deluge.configmanager.close(CORE_CONFIG)
 
     self._initialized = False
 
+    if self._notify_call and self._notify_call.active():
+      self._notify_call.cancel()
+    self._notify_call = None
+
+    if self._journal_call and self._journal_call.active():
+      self._journal_call.cancel()
+    self._journal_call = None
+
+    self._cancel_autolabel_job()
+    self._cancel_option_sync_job()
+
     rs = deluge.component.get("RPCServer")
     if self._orig_set_torrent and "label.set_torrent" in rs.factory.methods:
       rs.factory.methods["label.set_torrent"] = self._orig_set_torrent
@@ -367,10 +555,11 @@ class Core(CorePluginBase):
     deluge.component.get("CorePluginManager").deregister_status_field(
       labelplus.common.STATUS_NAME)
 
-    if (labelplus.common.STATUS_ID in
-        deluge.component.get("FilterManager").registered_filters):
-      deluge.component.get("FilterManager").deregister_filter(
-        labelplus.common.STATUS_ID)
+    for filter_id in (labelplus.common.STATUS_ID,
+        labelplus.common.FILTER_TREE_ID):
+      if (filter_id in
+          deluge.component.get("FilterManager").registered_filters):
+        deluge.component.get("FilterManager").deregister_filter(filter_id)
 
     self._rpc_deregister(labelplus.common.PLUGIN_NAME)
 
@@ -397,12 +586,11 @@ class Core(CorePluginBase):
   def _save_config_update_loop(self):
 
     if self._initialized:
-      last_changed = max(self._timestamp["labels_changed"],
-        self._timestamp["mappings_changed"])
+      self._mapping_store.flush()
 
-      if self._timestamp["last_saved"] <= last_changed:
-        self._config.save()
-        self._timestamp["last_saved"] = datetime.datetime.now()
+      if (self._config_dirty or
+          self._timestamp["last_saved"] <= self._timestamp["labels_changed"]):
+        self._save_config()
 
       twisted.internet.reactor.callLater(CONFIG_SAVE_INTERVAL,
         self._save_config_update_loop)
@@ -411,15 +599,128 @@ class Core(CorePluginBase):
   def _shared_limit_update_loop(self):
 
     if self._initialized:
-      for id in self._shared_limit_index:
-        if id in self._labels:
-          self._do_update_shared_limit(id)
+      now = time.time()
+      roots = self._get_shared_limit_roots()
+
+      for id in self._shared_limit_schedule.keys():
+        if id not in roots:
+          del self._shared_limit_schedule[id]
+
+      due = [x for x in roots if x not in self._shared_limit_schedule or
+        self._shared_limit_schedule[x]["next_run"] <= now]
+
+      if due:
+        results = self._do_update_shared_limits(due)
+        for id in due:
+          self._schedule_shared_limit(id, results[id], now)
 
-      twisted.internet.reactor.callLater(
-        self._prefs["options"]["shared_limit_interval"],
+      twisted.internet.reactor.callLater(SHARED_LIMIT_TICK,
         self._shared_limit_update_loop)
 
 
+  # Section: Change Notification
+
+  def _mark_changed(self, *keys):
+
+    now = datetime.datetime.now()
+
+    for key in keys:
+      self._timestamp[key] = now
+
+    if not self._notify_call or not self._notify_call.active():
+      self._notify_call = twisted.internet.reactor.callLater(
+        CHANGE_NOTIFY_DELAY, self._emit_changed_event)
+
+    self._schedule_journal_sync()
+
+
+  def _emit_changed_event(self):
+
+    self._notify_call = None
+
+    if self._initialized:
+      last_changed = max(self._timestamp["labels_changed"],
+        self._timestamp["mappings_changed"])
+
+      deluge.component.get("EventManager").emit(
+        LabelPlusChangedEvent(cPickle.dumps(last_changed)))
+
+
+  # Section: Persistence
+
+  def _journal_label(self, label_id):
+
+    self._dirty_labels.add(label_id)
+    self._config_dirty = True
+    self._schedule_journal_sync()
+
+
+  def _schedule_journal_sync(self):
+
+    if not self._journal_call or not self._journal_call.active():
+      self._journal_call = twisted.internet.reactor.callLater(
+        JOURNAL_SYNC_DELAY, self._sync_journal)
+
+
+  def _get_label_records(self):
+
+    records = [(x, copy.deepcopy(self._labels.get(x)))
+      for x in self._dirty_labels]
+    self._dirty_labels.clear()
+
+    return records
+
+
+  def _sync_journal(self):
+
+    self._journal_call = None
+
+    if self._initialized:
+      records = self._get_label_records()
+      if records:
+        self._write_queue.put(self._label_journal.append, records)
+
+      self._mapping_store.flush()
+
+
+  def _save_config(self, wait=False):
+
+    def save(records):
+
+      # Journal first so replaying it over the saved config is harmless. If
+      # the save fails, the journal is kept and the save is retried.
+      self._label_journal.append(records)
+
+      if self._config.save() is False:
+        raise IOError("Unable to save %s" % CORE_CONFIG)
+
+      self._label_journal.reset(0)
+
+
+    def on_saved(result):
+
+      if result:
+        self._timestamp["last_saved"] = now
+      else:
+        self._config_dirty = True
+
+
+    now = datetime.datetime.now()
+    records = self._get_label_records()
+    self._config_dirty = False
+
+    # The config is saved from a copy, so it cannot change during the save
+    data = self._config.config
+    data["labels"] = copy.deepcopy(self._labels)
+    data["prefs"] = copy.deepcopy(self._prefs)
+
+    if wait:
+      self._write_queue.run(save, records)
+      on_saved(True)
+    else:
+      self._write_queue.put(save, records).addCallback(on_saved)
+
+
   # Section: Public API: General
 
   @deluge.core.rpcserver.export
@@ -457,8 +758,7 @@ class Core(CorePluginBase):
     self._normalize_label_options(prefs["label"])
     self._prefs["label"].update(prefs["label"])
 
-    self._config.save()
-    self._timestamp["last_saved"] = datetime.datetime.now()
+    self._save_config()
 
 
   @deluge.core.rpcserver.export
@@ -523,6 +823,29 @@ class Core(CorePluginBase):
     return usages
 
 
+  @deluge.core.rpcserver.export
+  @check_init
+  def get_shared_limit_stats(self):
+
+    return dict(self._shared_limit_stats)
+
+
+  @deluge.core.rpcserver.export
+  @check_init
+  def get_shared_limit_schedule(self):
+
+    schedule = {}
+
+    for id in self._shared_limit_schedule:
+      entry = self._shared_limit_schedule[id]
+      schedule[id] = {
+        "interval": entry["interval"],
+        "next_run": entry["next_run"],
+      }
+
+    return schedule
+
+
   # Deprecated
   @deluge.core.rpcserver.export
   @check_init
@@ -544,7 +867,7 @@ class Core(CorePluginBase):
 
   @deluge.core.rpcserver.export
   @check_init
-  def get_label_updates(self, since=None):
+  def get_label_updates(self, since=None, delta=False):
 
     if since:
       t = cPickle.loads(since)
@@ -555,8 +878,7 @@ class Core(CorePluginBase):
       self._timestamp["mappings_changed"])
 
     if t <= last_changed:
-      u = LabelUpdate(LabelUpdate.TYPE_FULL, datetime.datetime.now(),
-        self._get_labels_data())
+      u = self._get_label_update(t, delta)
       return cPickle.dumps(u)
     else:
       return None
@@ -565,7 +887,7 @@ class Core(CorePluginBase):
   # New get_label_updates candidate, use dict instead of LabelUpdate class
   @deluge.core.rpcserver.export
   @check_init
-  def get_label_updates_dict(self, since=None):
+  def get_label_updates_dict(self, since=None, delta=False):
 
     if since:
       t = cPickle.loads(since)
@@ -576,8 +898,7 @@ class Core(CorePluginBase):
       self._timestamp["mappings_changed"])
 
     if t <= last_changed:
-      u = LabelUpdate(LabelUpdate.TYPE_FULL, datetime.datetime.now(),
-        self._get_labels_data())
+      u = self._get_label_update(t, delta)
 
       return {
         "type": u.type,
@@ -602,7 +923,7 @@ class Core(CorePluginBase):
 
     id = self._add_label(parent_id, label_name)
 
-    self._timestamp["labels_changed"] = datetime.datetime.now()
+    self._mark_changed("labels_changed")
 
     return id
 
@@ -618,7 +939,7 @@ class Core(CorePluginBase):
 
     self._rename_label(label_id, label_name)
 
-    self._timestamp["labels_changed"] = datetime.datetime.now()
+    self._mark_changed("labels_changed")
 
 
   @deluge.core.rpcserver.export
@@ -642,7 +963,7 @@ class Core(CorePluginBase):
     else:
       self._move_label(label_id, dest_id, dest_name)
 
-    self._timestamp["labels_changed"] = datetime.datetime.now()
+    self._mark_changed("labels_changed")
 
 
   @deluge.core.rpcserver.export
@@ -656,8 +977,10 @@ class Core(CorePluginBase):
 
     self._remove_label(label_id)
 
-    self._timestamp["labels_changed"] = datetime.datetime.now()
-    self._timestamp["mappings_changed"] = datetime.datetime.now()
+    self._mark_changed("labels_changed", "mappings_changed")
+
+    # Debug check after a bulk unlabel, skipped when run with -O
+    assert(self._check_unlabeled_index())
 
 
   # Section: Public API: Label: Options
@@ -686,6 +1009,52 @@ class Core(CorePluginBase):
     self._set_label_options(label_id, options_in, apply_to_all)
 
 
+  # Section: Public API: Torrent Options
+
+  @deluge.core.rpcserver.export
+  @check_init
+  def get_option_sync_progress(self):
+
+    job = self._option_sync_job
+    if not job:
+      return None
+
+    return {
+      "processed": job["position"],
+      "total": len(job["torrent_ids"]),
+      "applied": job["applied"],
+      "skipped": job["skipped"],
+    }
+
+
+  # Section: Public API: Autolabel
+
+  @deluge.core.rpcserver.export
+  @check_init
+  def get_autolabel_progress(self):
+
+    job = self._autolabel_job
+    if not job:
+      return None
+
+    return {
+      "label_id": job["label_id"],
+      "apply_to_all": job["apply_to_all"],
+      "processed": job["position"],
+      "total": len(job["torrent_ids"]),
+      "changed": job["changed"],
+    }
+
+
+  @deluge.core.rpcserver.export
+  @check_init
+  def cancel_autolabel(self):
+
+    log.debug("Cancelling autolabel job")
+
+    self._cancel_autolabel_job()
+
+
   # Section: Public API: Torrent-Label
 
   @deluge.core.rpcserver.export
@@ -726,7 +1095,10 @@ class Core(CorePluginBase):
     if self._prefs["options"]["move_on_changes"]:
       self._move_torrents(torrent_ids)
 
-    self._timestamp["mappings_changed"] = datetime.datetime.now()
+    self._mark_changed("mappings_changed")
+
+    # Debug check after a bulk relabel, skipped when run with -O
+    assert(self._check_unlabeled_index())
 
 
   # Section: Public Callbacks
@@ -734,23 +1106,30 @@ class Core(CorePluginBase):
   @check_init
   def on_torrent_added(self, torrent_id):
 
+    if torrent_id not in self._mappings:
+      self._unlabeled_index.add(torrent_id)
+
     label_id = self._do_autolabel_torrent(torrent_id)
 
     if label_id != labelplus.common.label.ID_NONE:
       self._move_torrents([torrent_id])
 
-    self._timestamp["mappings_changed"] = datetime.datetime.now()
+    self._mark_changed("mappings_changed")
 
 
   @check_init
   def on_torrent_removed(self, torrent_id):
 
+    self._applied_limits.pop(torrent_id, None)
+
     if torrent_id in self._mappings:
       label_id = self._mappings[torrent_id]
       self._remove_torrent_label(torrent_id)
       log.debug("Removing torrent %r from label %r", torrent_id, label_id)
 
-    self._timestamp["mappings_changed"] = datetime.datetime.now()
+    self._unlabeled_index.discard(torrent_id)
+
+    self._mark_changed("mappings_changed")
 
 
   @check_init
@@ -784,12 +1163,23 @@ class Core(CorePluginBase):
     return self._filter_by_label(torrent_ids, label_ids)
 
 
+  @check_init
+  def filter_by_label_tree(self, torrent_ids, label_ids):
+
+    return self._filter_by_label(torrent_ids,
+      self._get_label_tree_ids(label_ids))
+
+
   # Section: General
 
   def _get_daemon_info(self):
 
     info = {
       "os.path": os.path.__name__,
+      "change_events": True,
+      "delta_updates": True,
+      "tree_filter": True,
+      "options_synced": self._option_sync_job is None,
     }
 
     return info
@@ -829,6 +1219,12 @@ class Core(CorePluginBase):
     if options["shared_limit_interval"] < 1:
       options["shared_limit_interval"] = 1
 
+    if options["autolabel_batch_size"] < 1:
+      options["autolabel_batch_size"] = 1
+
+    if options["shared_limit_hysteresis"] < 0.0:
+      options["shared_limit_hysteresis"] = 0.0
+
 
   # Section: Label: Queries
 
@@ -837,20 +1233,32 @@ class Core(CorePluginBase):
     assert(parent_id == labelplus.common.label.ID_NULL or
       parent_id in self._labels)
 
-    i = 0
-    label_obj = {}
+    entry = self._index[parent_id]
 
     if parent_id == labelplus.common.label.ID_NULL:
       prefix = ""
     else:
       prefix = "%s:" % parent_id
 
-    while label_obj is not None:
+    while True:
+      if entry["free_ids"]:
+        i = heapq.heappop(entry["free_ids"])
+      else:
+        i = entry["next_id"]
+        entry["next_id"] += 1
+
       id = "%s%s" % (prefix, i)
-      label_obj = self._labels.get(id)
-      i += 1
+      if id not in self._labels:
+        return id
 
-    return id
+
+  def _release_id(self, label_id):
+
+    parent_id = labelplus.common.label.get_parent_id(label_id)
+    num = get_id_number(label_id)
+
+    if parent_id in self._index and num is not None:
+      heapq.heappush(self._index[parent_id]["free_ids"], num)
 
 
   def _get_children_names(self, parent_id):
@@ -955,6 +1363,67 @@ class Core(CorePluginBase):
     return data
 
 
+  def _get_changed_labels_data(self, since):
+
+    data = {}
+
+    for id, timestamp in reversed(self._change_journal.items()):
+      if timestamp < since:
+        break
+
+      if id in self._labels:
+        data[id] = {
+          "name": self._labels[id]["name"],
+          "count": len(self._index[id]["torrents"]),
+        }
+      else:
+        data[id] = None
+
+    total_count = len(self._torrents)
+
+    data[labelplus.common.label.ID_ALL] = {
+      "name": labelplus.common.label.ID_ALL,
+      "count": total_count,
+    }
+
+    data[labelplus.common.label.ID_NONE] = {
+      "name": labelplus.common.label.ID_NONE,
+      "count": total_count-len(self._mappings),
+    }
+
+    return data
+
+
+  def _get_label_update(self, since, delta=False):
+
+    # Older clients treat every update as full, so deltas are opt-in
+    if delta and since > self._timestamp["journal_trimmed"]:
+      return LabelUpdate(LabelUpdate.TYPE_DELTA, datetime.datetime.now(),
+        self._get_changed_labels_data(since))
+    else:
+      return LabelUpdate(LabelUpdate.TYPE_FULL, datetime.datetime.now(),
+        self._get_labels_data())
+
+
+  # Section: Label: Change Journal
+
+  def _record_label_change(self, label_id):
+
+    if label_id in labelplus.common.label.RESERVED_IDS:
+      return
+
+    journal = self._change_journal
+
+    if label_id in journal:
+      del journal[label_id]
+
+    journal[label_id] = datetime.datetime.now()
+
+    if len(journal) > CHANGE_JOURNAL_SIZE:
+      id, timestamp = journal.popitem(last=False)
+      self._timestamp["journal_trimmed"] = timestamp
+
+
   # Section: Label: Modifiers
 
   def _add_label(self, parent_id, label_name):
@@ -982,7 +1451,9 @@ class Core(CorePluginBase):
     self._index[id] = {
       "fullname": self._resolve_fullname(id),
       "children": [],
-      "torrents": [],
+      "next_id": 0,
+      "free_ids": [],
+      "torrents": set(),
     }
 
     for path_type in labelplus.common.config.PATH_TYPES:
@@ -990,7 +1461,12 @@ class Core(CorePluginBase):
         self._resolve_path(id, path_type)
 
     if self._labels[id]["options"]["shared_limit"]:
-      self._shared_limit_index.append(id)
+      self._shared_limit_index.add(id)
+
+    self._reset_shared_limit_schedule(id)
+    self._update_autolabel_index(id)
+    self._record_label_change(id)
+    self._journal_label(id)
 
     return id
 
@@ -1009,6 +1485,8 @@ class Core(CorePluginBase):
     parent_id = labelplus.common.label.get_parent_id(label_id)
     self._validate_name(parent_id, label_name)
     self._labels[label_id]["name"] = label_name
+    self._record_label_change(label_id)
+    self._journal_label(label_id)
 
     self._build_fullname_index(label_id)
 
@@ -1034,18 +1512,25 @@ class Core(CorePluginBase):
         "fullname": self._resolve_fullname(id),
         "torrents": self._index[label_id]["torrents"],
         "children": [],
+        "next_id": 0,
+        "free_ids": [],
       }
 
       if label_id in self._shared_limit_index:
         self._shared_limit_index.remove(label_id)
-        self._shared_limit_index.append(id)
+        self._shared_limit_index.add(id)
+
+      self._autolabel_index[id] = self._autolabel_index.pop(label_id)
+      self._autolabel_matcher = None
 
       parent_id = labelplus.common.label.get_parent_id(label_id)
       if parent_id in self._index:
         self._index[parent_id]["children"].remove(label_id)
+        self._release_id(label_id)
 
       for torrent_id in self._index[label_id]["torrents"]:
         self._mappings[torrent_id] = id
+        self._mapping_store.record(torrent_id)
 
       for child_id in list(self._index[label_id]["children"]):
         reparent(child_id, id)
@@ -1053,6 +1538,11 @@ class Core(CorePluginBase):
       del self._index[label_id]
       del self._labels[label_id]
 
+      self._record_label_change(label_id)
+      self._record_label_change(id)
+      self._journal_label(label_id)
+      self._journal_label(id)
+
       return id
 
 
@@ -1068,9 +1558,17 @@ class Core(CorePluginBase):
       pass
 
     self._validate_name(dest_id, dest_name)
+
+    self._reset_shared_limit_schedule(label_id)
     id = reparent(label_id, dest_id)
+    self._reset_shared_limit_schedule(id)
+
+    # Shares from the old tree do not carry over to the new one
+    for child_id in [id] + self._get_descendent_labels(id):
+      self._release_shared_limits(self._index[child_id]["torrents"])
 
     self._labels[id]["name"] = dest_name
+    self._record_label_change(id)
 
     for path_type in labelplus.common.config.PATH_TYPES:
       self._update_paths(id, path_type)
@@ -1085,12 +1583,15 @@ class Core(CorePluginBase):
 
     assert(label_id in self._labels)
 
-    if label_id in self._shared_limit_index:
-      self._shared_limit_index.remove(label_id)
+    self._reset_shared_limit_schedule(label_id)
+    self._shared_limit_index.discard(label_id)
+    self._autolabel_index.pop(label_id, None)
+    self._autolabel_matcher = None
 
     parent_id = labelplus.common.label.get_parent_id(label_id)
     if parent_id in self._index:
       self._index[parent_id]["children"].remove(label_id)
+      self._release_id(label_id)
 
     for id in list(self._index[label_id]["children"]):
       self._remove_label(id)
@@ -1105,6 +1606,9 @@ class Core(CorePluginBase):
     del self._index[label_id]
     del self._labels[label_id]
 
+    self._record_label_change(label_id)
+    self._journal_label(label_id)
+
     if self._prefs["options"]["move_on_changes"]:
       self._move_torrents(torrent_ids)
 
@@ -1160,6 +1664,13 @@ class Core(CorePluginBase):
           case not in labelplus.common.config.autolabel.CASES or
           (not query and prop != labelplus.common.config.autolabel.PROP_LABEL)):
         options["autolabel_rules"].remove(rule)
+        continue
+
+      if op == labelplus.common.config.autolabel.OP_MATCHES_REGEX:
+        try:
+          re.compile(query)
+        except re.error:
+          options["autolabel_rules"].remove(rule)
 
 
   def _set_label_options(self, label_id, options_in, apply_to_all=None):
@@ -1167,26 +1678,29 @@ class Core(CorePluginBase):
     assert(label_id in self._labels)
 
     options = self._labels[label_id]["options"]
-
-    old = {
-      "download_settings": options["download_settings"],
-      "download_location": options["download_location"],
-      "download_location_path": options["download_location_path"],
-      "move_completed": options["move_completed"],
-      "move_completed_path": options["move_completed_path"],
-    }
+    old = dict(options)
 
     self._normalize_label_options(options_in, self._prefs["label"])
     options.update(options_in)
+    self._journal_label(label_id)
 
-    if label_id in self._shared_limit_index:
-      self._shared_limit_index.remove(label_id)
+    self._shared_limit_index.discard(label_id)
 
     if options["bandwidth_settings"] and options["shared_limit"]:
-      self._shared_limit_index.append(label_id)
+      self._shared_limit_index.add(label_id)
 
-    for id in self._index[label_id]["torrents"]:
-      self._apply_torrent_options(id)
+    self._update_autolabel_index(label_id)
+
+    groups = self._get_changed_option_groups(old, options)
+    if groups:
+      self._apply_label_torrent_options(label_id, groups)
+
+    if "bandwidth_settings" in groups:
+      self._reset_shared_limit_schedule(label_id)
+
+      # Sublabels may have been covered by this label's shared limit
+      for id in self._get_descendent_labels(label_id):
+        self._release_shared_limits(self._index[id]["torrents"])
 
     path_toggled_on = False
     if options["download_settings"]:
@@ -1207,7 +1721,7 @@ class Core(CorePluginBase):
         changed_paths.append(path_type)
 
     if changed_paths:
-      self._timestamp["labels_changed"] = datetime.datetime.now()
+      self._mark_changed("labels_changed")
 
       if labelplus.common.config.PATH_MOVE_COMPLETED in changed_paths:
         self._apply_move_completed_paths(label_id, True)
@@ -1275,6 +1789,7 @@ class Core(CorePluginBase):
       return
 
     options["%s_path" % path_type] = path
+    self._journal_label(label_id)
 
     for id in self._index[label_id]["children"]:
       self._update_paths(id, path_type)
@@ -1312,118 +1827,239 @@ class Core(CorePluginBase):
 
   # Section: Label: Shared Limit
 
-  def _do_update_shared_limit(self, label_id):
+  def _get_shared_limit_roots(self):
+    # Shared limit labels that have no shared limit ancestor
 
-    assert(label_id in self._labels)
+    roots = []
 
-    options = self._labels[label_id]["options"]
-    shared_download_limit = options["max_download_speed"]
-    shared_upload_limit = options["max_upload_speed"]
+    for id in self._shared_limit_index:
+      if id not in self._labels:
+        continue
 
-    if shared_download_limit < 0.0 and shared_upload_limit < 0.0:
-      return
+      parent_id = labelplus.common.label.get_parent_id(id)
+      while (parent_id != labelplus.common.label.ID_NULL and
+          parent_id not in self._shared_limit_index):
+        parent_id = labelplus.common.label.get_parent_id(parent_id)
 
-    torrent_ids = self._index[label_id]["torrents"]
+      if parent_id == labelplus.common.label.ID_NULL:
+        roots.append(id)
 
-    statuses = self._get_torrent_statuses(
-      torrent_ids, {"state": ["Seeding", "Downloading"]},
-      ["download_payload_rate", "upload_payload_rate"])
+    return roots
 
-    num_active_downloads = \
-      sum(1 for id in statuses if statuses[id]["download_payload_rate"] > 0.0)
-    download_rate_sum = \
-      sum(statuses[id]["download_payload_rate"] for id in statuses) / 1024.0
-    download_diff = download_rate_sum - shared_download_limit
 
-    num_active_uploads = \
-      sum(1 for id in statuses if statuses[id]["upload_payload_rate"] > 0.0)
-    upload_rate_sum = \
-      sum(statuses[id]["upload_payload_rate"] for id in statuses) / 1024.0
-    upload_diff = upload_rate_sum - shared_upload_limit
+  def _reset_shared_limit_schedule(self, label_id):
+    # Rebalance the tree holding the label on the next tick
 
-    # Modify individual torrent bandwidth limits based on shared limit
-    for id in statuses:
-      torrent = self._torrents[id]
-      status = statuses[id]
+    id = label_id
+    while id != labelplus.common.label.ID_NULL:
+      self._shared_limit_schedule.pop(id, None)
+      id = labelplus.common.label.get_parent_id(id)
 
-      # Determine new torrent download limit
-      if shared_download_limit < 0.0:
-        torrent.set_max_download_speed(-1.0)
-      else:
-        download_rate = status["download_payload_rate"] / 1024.0
-        limit = download_rate
-
-        if download_diff >= 0.0:
-        # Total is above shared limit; deduct based on usage
-          usage_ratio = download_rate / download_rate_sum
-          limit -= (usage_ratio * download_diff)
-        elif download_rate > 0.0:
-        # Total is below and torrent active; increase by a slice of unused
-          limit += abs(download_diff) / num_active_downloads
+
+  def _schedule_shared_limit(self, label_id, result, now):
+    # Back off stable or idle trees, tighten trees that are over a limit
+
+    base = self._prefs["options"]["shared_limit_interval"]
+
+    entry = self._shared_limit_schedule.get(label_id)
+    if not entry:
+      entry = {
+        "interval": base,
+        "rate": None,
+      }
+      self._shared_limit_schedule[label_id] = entry
+
+    interval = entry["interval"]
+    last_rate = entry["rate"]
+    rate = result["rate"]
+
+    if result["over_limit"]:
+      interval = max(SHARED_LIMIT_MIN_INTERVAL, interval/2.0)
+    elif rate == 0.0 or (last_rate is not None and
+        abs(rate-last_rate) <= SHARED_LIMIT_STABLE_RATIO*max(rate, last_rate)):
+      interval = min(base*SHARED_LIMIT_MAX_BACKOFF, interval*2.0)
+    else:
+      interval = base
+
+    entry["interval"] = interval
+    entry["rate"] = rate
+    entry["next_run"] = now + interval
+
+
+  def _do_update_shared_limits(self, root_ids):
+
+    results = {}
+
+    roots = []
+    label_ids = []
+    torrent_ids = set()
+    root_map = {}
+
+    for id in root_ids:
+      results[id] = {
+        "rate": 0.0,
+        "over_limit": False,
+      }
+
+      subtree = [id] + self._get_descendent_labels(id)
+
+      has_limit = False
+      for label_id in subtree:
+        if label_id in self._shared_limit_index:
+          options = self._labels[label_id]["options"]
+          if (options["max_download_speed"] >= 0.0 or
+              options["max_upload_speed"] >= 0.0):
+            has_limit = True
+            break
+
+      if not has_limit:
+        for label_id in subtree:
+          self._release_shared_limits(self._index[label_id]["torrents"])
+        continue
+
+      roots.append(id)
+      label_ids += subtree
+
+      for label_id in subtree:
+        torrent_ids.update(self._index[label_id]["torrents"])
+        root_map[label_id] = id
+
+    if not roots:
+      return results
+
+    samples = self._get_rate_samples(torrent_ids)
+
+    for key, rate_key in SHARED_LIMIT_FIELDS:
+      nodes = {}
+      ceilings = {}
+
+      for id in label_ids:
+        options = self._labels[id]["options"]
+
+        if id in self._shared_limit_index:
+          limit = options[key]
         else:
-        # Total is below and torrent inactive; give chance by setting max
-          limit = shared_download_limit
+          limit = -1.0
 
-        if limit < 0.1: limit = 0.1
-        torrent.set_max_download_speed(limit)
+          # Torrents keep their own label's per-torrent limit as a ceiling
+          if options["bandwidth_settings"]:
+            ceiling = options[key]
+          else:
+            ceiling = self._core["%s_per_torrent" % key]
 
-      # Determine new torrent upload limit
-      if shared_upload_limit < 0.0:
-        torrent.set_max_upload_speed(-1.0)
-      else:
-        upload_rate = status["upload_payload_rate"] / 1024.0
-        limit = upload_rate
-
-        if upload_diff >= 0.0:
-          usage_ratio = upload_rate / upload_rate_sum
-          limit -= (usage_ratio * upload_diff)
-        elif upload_rate > 0.0:
-          limit += abs(upload_diff) / num_active_uploads
+          if ceiling >= 0.0:
+            for torrent_id in self._index[id]["torrents"]:
+              ceilings[torrent_id] = ceiling
+
+        nodes[id] = {
+          "limit": limit,
+          "torrents": self._index[id]["torrents"],
+          "children": self._index[id]["children"],
+        }
+
+      rates = {}
+      for id in samples:
+        rates[id] = samples[id][rate_key] / 1024.0
+
+      limits = labelplus.core.shared_limit.allocate(nodes, roots, rates,
+        ceilings)
+
+      for id in limits:
+        self._apply_shared_limit(id, key, limits[id])
+
+      for id in labelplus.core.shared_limit.get_unlimited_nodes(nodes, roots):
+        self._release_shared_limits(self._index[id]["torrents"], (key,))
+
+      sums = labelplus.core.shared_limit.get_subtree_rates(nodes, roots,
+        rates)
+
+      for id in roots:
+        results[id]["rate"] += sums[id]
+
+      for id in nodes:
+        limit = nodes[id]["limit"]
+        if limit >= 0.0 and sums[id] > limit:
+          results[root_map[id]]["over_limit"] = True
+
+    return results
+
+
+  def _apply_shared_limit(self, torrent_id, key, limit):
+    # Push limit to torrent only if it differs enough from the last one
+
+    assert(torrent_id in self._torrents)
+
+    applied = self._applied_limits.setdefault(torrent_id, {})
+    last = applied.get(key)
+
+    if last is not None:
+      threshold = self._prefs["options"]["shared_limit_hysteresis"]
+
+      if (last < 0.0) == (limit < 0.0):
+        if limit < 0.0 or abs(limit-last) <= threshold*max(limit, last):
+          self._shared_limit_stats["suppressed"] += 1
+          return
+
+    getattr(self._torrents[torrent_id], "set_%s" % key)(limit)
+    applied[key] = limit
+
+    self._shared_limit_stats["applied"] += 1
+
+
+  def _release_shared_limits(self, torrent_ids,
+      keys=("max_download_speed", "max_upload_speed")):
+    # Give torrents no longer under a shared limit their own limit back
+
+    for id in torrent_ids:
+      applied = self._applied_limits.get(id)
+      if not applied or id not in self._torrents:
+        continue
+
+      options = self._labels[self._mappings[id]]["options"]
+
+      for key in keys:
+        if key not in applied:
+          continue
+
+        del applied[key]
+
+        if options["bandwidth_settings"]:
+          limit = options[key]
         else:
-          limit = shared_upload_limit
+          limit = self._core["%s_per_torrent" % key]
 
-        if limit < 0.1: limit = 0.1
-        torrent.set_max_upload_speed(limit)
+        getattr(self._torrents[id], "set_%s" % key)(limit)
 
 
   # Section: Torrent: Queries
 
-  def _get_torrent_statuses(self, torrent_ids, filters, fields):
+  def _get_rate_samples(self, torrent_ids):
+    # Sample payload rates of active torrents directly from libtorrent
 
     assert(all(x in self._torrents for x in torrent_ids))
 
-    statuses = {}
-
-    for filter in filters:
-      if filter not in fields:
-        fields.append(filter)
+    samples = {}
 
     for id in torrent_ids:
-      status = self._torrents[id].get_status(fields)
-
-      if not filters:
-        statuses[id] = status
-      else:
-        passed = True
+      torrent = self._torrents[id]
+      if torrent.state not in ACTIVE_STATES:
+        continue
 
-        for filter in filters:
-          if status[filter] not in filters[filter]:
-            passed = False
-            break
+      status = torrent.handle.status()
 
-        if passed:
-          statuses[id] = status
+      samples[id] = {
+        "download_payload_rate": status.download_payload_rate,
+        "upload_payload_rate": status.upload_payload_rate,
+      }
 
-    return statuses
+    return samples
 
 
   def _get_torrent_bandwidth_usage(self, torrent_ids):
 
     assert(all(x in self._torrents for x in torrent_ids))
 
-    statuses = self._get_torrent_statuses(
-      torrent_ids, {"state": ["Seeding", "Downloading"]},
-      ["download_payload_rate", "upload_payload_rate"])
+    statuses = self._get_rate_samples(torrent_ids)
 
     download_rate_sum = 0.0
     upload_rate_sum = 0.0
@@ -1442,6 +2078,8 @@ class Core(CorePluginBase):
 
     assert(torrent_id in self._torrents)
 
+    self._applied_limits.pop(torrent_id, None)
+
     torrent = self._torrents[torrent_id]
 
     # Download settings
@@ -1464,6 +2102,50 @@ class Core(CorePluginBase):
     torrent.set_remove_at_ratio(self._core["remove_seed_at_ratio"])
 
 
+  def _get_option_setters(self, options, groups=OPTION_GROUPS):
+    # Get (setter name, value) pairs for the enabled option groups
+
+    setters = []
+
+    if "download_settings" in groups and options["download_settings"]:
+      setters.append(("set_move_completed", options["move_completed"]))
+      setters.append(("set_prioritize_first_last",
+        options["prioritize_first_last"]))
+
+      if options["move_completed"]:
+        setters.append(("set_move_completed_path",
+          options["move_completed_path"]))
+
+    if "bandwidth_settings" in groups and options["bandwidth_settings"]:
+      setters.append(("set_max_download_speed", options["max_download_speed"]))
+      setters.append(("set_max_upload_speed", options["max_upload_speed"]))
+      setters.append(("set_max_connections", options["max_connections"]))
+      setters.append(("set_max_upload_slots", options["max_upload_slots"]))
+
+    if "queue_settings" in groups and options["queue_settings"]:
+      setters.append(("set_auto_managed", options["auto_managed"]))
+      setters.append(("set_stop_at_ratio", options["stop_at_ratio"]))
+
+      if options["stop_at_ratio"]:
+        setters.append(("set_stop_ratio", options["stop_ratio"]))
+        setters.append(("set_remove_at_ratio", options["remove_at_ratio"]))
+
+    return setters
+
+
+  def _get_changed_option_groups(self, old, new):
+
+    groups = set()
+
+    for group, keys in OPTION_GROUPS.iteritems():
+      for key in (group,) + keys:
+        if old.get(key) != new.get(key):
+          groups.add(group)
+          break
+
+    return groups
+
+
   def _apply_torrent_options(self, torrent_id):
 
     assert(torrent_id in self._torrents)
@@ -1474,42 +2156,145 @@ class Core(CorePluginBase):
       self._reset_torrent_options(torrent_id)
       return
 
-    options = self._labels[label_id]["options"]
+    self._applied_limits.pop(torrent_id, None)
+
     torrent = self._torrents[torrent_id]
 
-    if options["download_settings"]:
-      torrent.set_move_completed(options["move_completed"])
-      torrent.set_prioritize_first_last(options["prioritize_first_last"])
+    for name, value in self._get_option_setters(
+        self._labels[label_id]["options"]):
+      getattr(torrent, name)(value)
 
-      if options["move_completed"]:
-        torrent.set_move_completed_path(options["move_completed_path"])
 
-    if options["bandwidth_settings"]:
-      torrent.set_max_download_speed(options["max_download_speed"])
-      torrent.set_max_upload_speed(options["max_upload_speed"])
-      torrent.set_max_connections(options["max_connections"])
-      torrent.set_max_upload_slots(options["max_upload_slots"])
+  def _apply_label_torrent_options(self, label_id, groups):
+    # Apply only the given option groups to all torrents in the label
+
+    assert(label_id in self._labels)
 
-    if options["queue_settings"]:
-      torrent.set_auto_managed(options["auto_managed"])
-      torrent.set_stop_at_ratio(options["stop_at_ratio"])
+    setters = self._get_option_setters(self._labels[label_id]["options"],
+      groups)
+    torrent_ids = [x for x in self._index[label_id]["torrents"]
+      if x in self._torrents]
 
-      if options["stop_at_ratio"]:
-        torrent.set_stop_ratio(options["stop_ratio"])
-        torrent.set_remove_at_ratio(options["remove_at_ratio"])
+    if "bandwidth_settings" in groups:
+      for id in torrent_ids:
+        self._applied_limits.pop(id, None)
+
+    for name, value in setters:
+      for id in torrent_ids:
+        getattr(self._torrents[id], name)(value)
+
+
+  # Section: Torrent: Option Sync
+
+  def _start_option_sync_job(self, torrent_ids):
+
+    self._cancel_option_sync_job()
+
+    if not torrent_ids:
+      return
+
+    self._option_sync_job = {
+      "torrent_ids": torrent_ids,
+      "position": 0,
+      "applied": 0,
+      "skipped": 0,
+      "call": None,
+    }
+
+    log.debug("Starting option sync job on %s torrents", len(torrent_ids))
+
+    self._option_sync_job["call"] = twisted.internet.reactor.callLater(0,
+      self._run_option_sync_job)
+
+
+  def _run_option_sync_job(self):
+
+    job = self._option_sync_job
+    job["call"] = None
+
+    if not self._initialized:
+      self._option_sync_job = None
+      return
+
+    start = job["position"]
+    end = start + OPTION_SYNC_BATCH_SIZE
+    setters = {}
+
+    for id in job["torrent_ids"][start:end]:
+      label_id = self._mappings.get(id)
+      if id not in self._torrents or label_id not in self._labels:
+        continue
+
+      if label_id not in setters:
+        setters[label_id] = self._get_option_setters(
+          self._labels[label_id]["options"])
+
+      if self._sync_torrent_options(id, setters[label_id]):
+        job["applied"] += 1
+      else:
+        job["skipped"] += 1
+
+    job["position"] = min(end, len(job["torrent_ids"]))
+
+    if job["position"] < len(job["torrent_ids"]):
+      job["call"] = twisted.internet.reactor.callLater(0,
+        self._run_option_sync_job)
+    else:
+      log.debug("Option sync job finished: %s applied, %s already in sync",
+        job["applied"], job["skipped"])
+      self._option_sync_job = None
+
+
+  def _sync_torrent_options(self, torrent_id, setters):
+    # Call only the setters whose value differs from the torrent's
+
+    torrent = self._torrents[torrent_id]
+    applied = False
+
+    for name, value in setters:
+      if torrent.options.get(SETTER_OPTIONS[name]) != value:
+        getattr(torrent, name)(value)
+        applied = True
+
+    if applied:
+      self._applied_limits.pop(torrent_id, None)
+
+    return applied
+
+
+  def _cancel_option_sync_job(self):
+
+    job = self._option_sync_job
+    if not job:
+      return
+
+    if job["call"] and job["call"].active():
+      job["call"].cancel()
+
+    self._option_sync_job = None
 
 
   # Section: Torrent-Label: Queries
 
   def _get_unlabeled_torrents(self):
 
-    torrent_ids = []
+    return self._unlabeled_index
 
-    for id in self._torrents:
-      if id not in self._mappings:
-        torrent_ids.append(id)
 
-    return torrent_ids
+  def _check_unlabeled_index(self):
+    # Compare the unlabeled index against a full recomputation
+
+    expected = set(x for x in self._torrents if x not in self._mappings)
+
+    missing = expected - self._unlabeled_index
+    extra = self._unlabeled_index - expected
+
+    if missing or extra:
+      log.warning("Unlabeled index mismatch: %s missing, %s extra",
+        len(missing), len(extra))
+      return False
+
+    return True
 
 
   def _get_torrent_label_id(self, torrent_id):
@@ -1526,16 +2311,46 @@ class Core(CorePluginBase):
     return self._index[label_id]["fullname"]
 
 
+  def _get_label_tree_ids(self, label_ids):
+    # Expand given labels to include all of their descendents
+
+    tree_ids = set(label_ids)
+
+    for id in label_ids:
+      if id in self._labels:
+        tree_ids.update(self._get_descendent_labels(id))
+
+    return tree_ids
+
+
+  def _get_label_members(self, label_id):
+
+    if label_id == labelplus.common.label.ID_NONE:
+      return self._unlabeled_index
+    elif label_id in self._labels:
+      return self._index[label_id]["torrents"]
+
+    return ()
+
+
   def _filter_by_label(self, torrent_ids, label_ids):
 
-    filtered = []
+    label_ids = set(label_ids)
+    members = [self._get_label_members(x) for x in label_ids]
 
-    for id in torrent_ids:
-      label_id = self._mappings.get(id, labelplus.common.label.ID_NONE)
-      if label_id in label_ids:
-        filtered.append(id)
+    # Walk label membership instead of all torrents when it is no larger
+    if sum(len(x) for x in members) <= len(torrent_ids)*FILTER_INDEX_RATIO:
+      if len(torrent_ids) == len(self._torrents):
+        candidates = self._torrents
+      else:
+        candidates = set(torrent_ids)
+
+      return [x for ids in members for x in ids if x in candidates]
 
-    return filtered
+    mappings = self._mappings
+
+    return [x for x in torrent_ids
+      if mappings.get(x, labelplus.common.label.ID_NONE) in label_ids]
 
 
   # Section: Torrent-Label: Modifiers
@@ -1545,8 +2360,13 @@ class Core(CorePluginBase):
     label_id = self._mappings.get(torrent_id, labelplus.common.label.ID_NONE)
     if label_id in self._index:
       self._index[label_id]["torrents"].remove(torrent_id)
+      self._record_label_change(label_id)
 
     del self._mappings[torrent_id]
+    self._mapping_store.record(torrent_id)
+
+    if torrent_id in self._torrents:
+      self._unlabeled_index.add(torrent_id)
 
 
   def _set_torrent_label(self, torrent_id, label_id):
@@ -1563,27 +2383,70 @@ class Core(CorePluginBase):
         self._reset_torrent_options(torrent_id)
     else:
       self._mappings[torrent_id] = label_id
-      self._index[label_id]["torrents"].append(torrent_id)
+      self._mapping_store.record(torrent_id)
+      self._unlabeled_index.discard(torrent_id)
+      self._index[label_id]["torrents"].add(torrent_id)
+      self._record_label_change(label_id)
       self._apply_torrent_options(torrent_id)
 
 
   # Section: Torrent-Label: Autolabel
 
-  def _has_autolabel_match(self, torrent_id, label_id):
+  def _update_autolabel_index(self, label_id):
 
-    assert(torrent_id in self._torrents)
     assert(label_id in self._labels)
 
     options = self._labels[label_id]["options"]
-    rules = options["autolabel_rules"]
-    match_all = options["autolabel_match_all"]
+
+    self._autolabel_index[label_id] = \
+      labelplus.common.config.autolabel.RuleSet(options["autolabel_rules"],
+        options["autolabel_match_all"])
+
+    self._autolabel_matcher = None
+
+
+  def _get_autolabel_matcher(self):
+
+    if self._autolabel_matcher is None:
+      label_ids = self._get_sorted_labels(cmp_length_then_value)
+
+      rulesets = [(x, self._autolabel_index[x]) for x in label_ids
+        if self._labels[x]["options"]["autolabel_settings"]]
+
+      self._autolabel_matcher = \
+        labelplus.common.config.autolabel.CombinedRuleSet(rulesets)
+
+    return self._autolabel_matcher
+
+
+  def _autolabel_uses_prop(self, label_ids, prop):
+
+    for id in label_ids:
+      if prop in self._autolabel_index[id].props:
+        return True
+
+    return False
+
+
+  def _get_autolabel_props(self, torrent_id, include_files=True):
+    # Build the property bundle that autolabel rules are evaluated against
+
+    assert(torrent_id in self._torrents)
+
+    fields = ["name", "trackers", "label"]
+    if include_files:
+      fields.append("files")
 
     status = deluge.component.get("Core").get_torrent_status(torrent_id,
-      ["name", "trackers", "files", "label"])
+      fields)
 
     name = status["name"]
     trackers = [x["url"] for x in status["trackers"]]
-    files = [x["path"] for x in status["files"]]
+
+    if include_files:
+      files = [x["path"] for x in status["files"]]
+    else:
+      files = []
 
     props = {
       labelplus.common.config.autolabel.PROP_NAME: [name],
@@ -1597,34 +2460,46 @@ class Core(CorePluginBase):
       label = status.get("label")
       props[labelplus.common.config.autolabel.PROP_LABEL] = [label]
 
-    return labelplus.common.config.autolabel.find_match(props,
-      rules, match_all)
+    return props
+
+
+  def _has_autolabel_match(self, props, label_id):
+
+    assert(label_id in self._labels)
+
+    return self._autolabel_index[label_id].match(props)
 
 
   def _find_autolabel_match(self, torrent_id):
 
     assert(torrent_id in self._torrents)
 
-    label_ids = self._get_sorted_labels(cmp_length_then_value)
+    matcher = self._get_autolabel_matcher()
+    if not matcher.props:
+      return labelplus.common.label.ID_NONE
 
-    for id in label_ids:
-      if self._labels[id]["options"]["autolabel_settings"]:
-        if self._has_autolabel_match(torrent_id, id):
-          return id
+    props = self._get_autolabel_props(torrent_id,
+      labelplus.common.config.autolabel.PROP_FILES in matcher.props)
+
+    label_id = matcher.match(props)
+    if label_id is None:
+      return labelplus.common.label.ID_NONE
 
-    return labelplus.common.label.ID_NONE
+    return label_id
 
 
-  def _do_autolabel_torrent(self, torrent_id):
+  def _do_autolabel_torrent(self, torrent_id, label_id=None):
 
     assert(torrent_id in self._torrents)
 
-    label_id = self._find_autolabel_match(torrent_id)
+    if label_id is None:
+      label_id = self._find_autolabel_match(torrent_id)
+
     if label_id != self._get_torrent_label_id(torrent_id):
       self._set_torrent_label(torrent_id, label_id)
       log.debug("Setting torrent %r to label %r", torrent_id, label_id)
 
-      self._timestamp["mappings_changed"] = datetime.datetime.now()
+      self._mark_changed("mappings_changed")
 
     return label_id
 
@@ -1633,16 +2508,76 @@ class Core(CorePluginBase):
 
     assert(label_id in self._labels)
 
+    self._cancel_autolabel_job()
+
+    self._autolabel_job = {
+      "label_id": label_id,
+      "apply_to_all": apply_to_all,
+      "torrent_ids": list(self._torrents),
+      "position": 0,
+      "changed": 0,
+      "call": None,
+    }
+
+    log.debug("Starting autolabel job for label %r on %s torrents", label_id,
+      len(self._autolabel_job["torrent_ids"]))
+
+    self._autolabel_job["call"] = twisted.internet.reactor.callLater(0,
+      self._run_autolabel_job)
+
+
+  def _run_autolabel_job(self):
+
+    job = self._autolabel_job
+    job["call"] = None
+
+    label_id = job["label_id"]
+    if not self._initialized or label_id not in self._labels:
+      self._autolabel_job = None
+      return
+
+    include_files = self._autolabel_uses_prop([label_id],
+      labelplus.common.config.autolabel.PROP_FILES)
+
+    start = job["position"]
+    end = start + self._prefs["options"]["autolabel_batch_size"]
     changed = False
 
-    for id in self._torrents:
-      if apply_to_all or id not in self._mappings:
-        if self._has_autolabel_match(id, label_id):
+    for id in job["torrent_ids"][start:end]:
+      if id not in self._torrents:
+        continue
+
+      if job["apply_to_all"] or id not in self._mappings:
+        props = self._get_autolabel_props(id, include_files)
+        if self._has_autolabel_match(props, label_id):
           self._set_torrent_label(id, label_id)
+          job["changed"] += 1
           changed = True
 
+    job["position"] = min(end, len(job["torrent_ids"]))
+
     if changed:
-      self._timestamp["mappings_changed"] = datetime.datetime.now()
+      self._mark_changed("mappings_changed")
+
+    if job["position"] < len(job["torrent_ids"]):
+      job["call"] = twisted.internet.reactor.callLater(0,
+        self._run_autolabel_job)
+    else:
+      log.debug("Autolabel job for label %r finished: %s torrents changed",
+        label_id, job["changed"])
+      self._autolabel_job = None
+
+
+  def _cancel_autolabel_job(self):
+
+    job = self._autolabel_job
+    if not job:
+      return
+
+    if job["call"] and job["call"].active():
+      job["call"].cancel()
+
+    self._autolabel_job = None
 
 
   # Section: Torrent-Label: Path Options
@@ -0,0 +1,216 @@
+#
+# journal.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import cPickle
+import logging
+import os
+import threading
+
+import twisted.internet
+import twisted.internet.defer
+import twisted.internet.threads
+
+
+log = logging.getLogger(__name__)
+
+
+#
+# Journal file format:
+#   generation (pickled)
+#   record (pickled)
+#   ...
+#
+# Records are appended in batches and synced to disk after each batch. A
+# record torn by a crash ends the journal; anything after it is discarded.
+#
+
+def write_file(path, data):
+
+  tmp_path = "%s.tmp" % path
+
+  with open(tmp_path, "wb") as f:
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+  # Windows cannot rename over an existing file
+  if os.name == "nt" and os.path.exists(path):
+    os.remove(path)
+
+  os.rename(tmp_path, path)
+
+
+class Journal(object):
+
+  # Section: Initialization
+
+  def __init__(self, path):
+
+    self.path = path
+
+
+  # Section: Public
+
+  def read(self):
+
+    generation = None
+    records = []
+
+    if not os.path.exists(self.path):
+      return generation, records
+
+    with open(self.path, "rb") as f:
+      try:
+        generation = cPickle.load(f)
+
+        while True:
+          records.append(cPickle.load(f))
+      except EOFError:
+        pass
+      except Exception as e:
+        log.warning("Discarding damaged tail of %s: %s", self.path, e)
+
+    return generation, records
+
+
+  def reset(self, generation):
+
+    write_file(self.path, cPickle.dumps(generation, cPickle.HIGHEST_PROTOCOL))
+
+
+  def append(self, records):
+
+    if not records:
+      return
+
+    data = "".join(cPickle.dumps(x, cPickle.HIGHEST_PROTOCOL)
+      for x in records)
+
+    with open(self.path, "ab") as f:
+      f.write(data)
+      f.flush()
+      os.fsync(f.fileno())
+
+
+#
+# File writes are queued and run one at a time in a worker thread, in the
+# order they were queued. put() returns a deferred that fires on the reactor
+# with whether the write succeeded. run() does a write on the calling thread
+# after everything queued ahead of it, for when the caller cannot return to
+# the reactor first, such as at shutdown.
+#
+
+class WriteQueue(object):
+
+  # Section: Initialization
+
+  def __init__(self):
+
+    self._ops = []
+    self._busy = False
+
+    # Guards the queue itself, only ever held briefly
+    self._lock = threading.Lock()
+
+    # Held from taking a write off the queue until it is done
+    self._write_lock = threading.Lock()
+
+
+  # Section: Public
+
+  def put(self, func, *args):
+
+    deferred = twisted.internet.defer.Deferred()
+
+    with self._lock:
+      self._ops.append((func, args, deferred))
+
+      if self._busy:
+        return deferred
+
+      self._busy = True
+
+    twisted.internet.threads.deferToThread(self._work)
+
+    return deferred
+
+
+  def run(self, func, *args):
+
+    done = []
+
+    try:
+      # Waits for the write in progress, then does the rest in order
+      with self._write_lock:
+        with self._lock:
+          ops = self._ops
+          self._ops = []
+
+        for op_func, op_args, deferred in ops:
+          done.append((deferred, self._call(op_func, *op_args)))
+
+        return func(*args)
+    finally:
+      for deferred, result in done:
+        deferred.callback(result)
+
+
+  # Section: Worker
+
+  def _work(self):
+
+    while True:
+      with self._write_lock:
+        with self._lock:
+          if not self._ops:
+            self._busy = False
+            return
+
+          func, args, deferred = self._ops.pop(0)
+
+        result = self._call(func, *args)
+
+      twisted.internet.reactor.callFromThread(deferred.callback, result)
+
+
+  def _call(self, func, *args):
+
+    try:
+      func(*args)
+      return True
+    except Exception as e:
+      log.error("Write failed: %s", e)
+      return False
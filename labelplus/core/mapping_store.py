@@ -0,0 +1,166 @@
+#
+# mapping_store.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import cPickle
+import logging
+import os
+
+import labelplus.core.journal
+
+
+log = logging.getLogger(__name__)
+
+
+COMPACT_MIN_RECORDS = 10000
+
+
+#
+# Torrent-label mappings kept apart from the main config
+#
+# The store consists of a snapshot file holding (generation, mappings) and a
+# journal of (torrent_id, label_id) records, where a label_id of None means
+# the mapping was removed. Changes are appended to the journal and the
+# snapshot is only rewritten once the journal outgrows the mappings.
+#
+# File writes go through a WriteQueue. Only the journal belonging to the
+# current snapshot generation is replayed, so a crash during compaction cannot
+# apply stale records.
+#
+
+class MappingStore(object):
+
+  # Section: Initialization
+
+  def __init__(self, path, write_queue):
+
+    self.data = {}
+
+    self._path = path
+    self._journal = labelplus.core.journal.Journal("%s.journal" % path)
+    self._write_queue = write_queue
+    self._generation = 0
+    self._journal_size = 0
+    self._needs_compact = False
+
+    self._dirty = set()
+
+
+  # Section: Public
+
+  def load(self):
+
+    generation = 0
+    data = {}
+
+    if os.path.exists(self._path):
+      with open(self._path, "rb") as f:
+        generation, data = cPickle.load(f)
+
+    journal_gen, records = self._journal.read()
+
+    if journal_gen == generation:
+      for torrent_id, label_id in records:
+        if label_id is None:
+          data.pop(torrent_id, None)
+        else:
+          data[torrent_id] = label_id
+    elif records:
+      log.debug("Skipping %s records from stale journal", len(records))
+
+    self.data.clear()
+    self.data.update(data)
+    self._generation = generation
+
+    if records or journal_gen != generation:
+      self._generation += 1
+      self._compact(dict(self.data), self._generation)
+
+    return self.data
+
+
+  def import_data(self, data):
+
+    self.data.update(data)
+    self._dirty.clear()
+    self._generation += 1
+    self._journal_size = 0
+
+    self._write_queue.run(self._compact, dict(self.data), self._generation)
+
+
+  def record(self, torrent_id):
+
+    self._dirty.add(torrent_id)
+
+
+  def flush(self):
+
+    if self._needs_compact or (self._journal_size + len(self._dirty) >=
+        max(COMPACT_MIN_RECORDS, len(self.data))):
+      self._dirty.clear()
+      self._generation += 1
+      self._journal_size = 0
+      self._needs_compact = False
+      self._write_queue.put(self._compact, dict(self.data),
+        self._generation)
+    elif self._dirty:
+      records = [(x, self.data.get(x)) for x in self._dirty]
+      self._dirty.clear()
+      self._journal_size += len(records)
+      self._write_queue.put(self._append, records)
+
+
+  # Section: Writing
+
+  def _compact(self, snapshot, generation):
+
+    try:
+      labelplus.core.journal.write_file(self._path,
+        cPickle.dumps((generation, snapshot), cPickle.HIGHEST_PROTOCOL))
+      self._journal.reset(generation)
+    except EnvironmentError:
+      self._needs_compact = True
+      raise
+
+
+  def _append(self, records):
+
+    try:
+      self._journal.append(records)
+    except EnvironmentError:
+      # Records may be missing from disk, so rewrite everything next time
+      self._needs_compact = True
+      raise
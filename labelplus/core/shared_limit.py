@@ -0,0 +1,223 @@
+#
+# shared_limit.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+#
+# Hierarchical shared limit allocation
+#
+# nodes format:
+# {
+#   "node_id": {
+#     "limit": shared limit in KiB/s, negative if none,
+#     "torrents": [torrent_ids],
+#     "children": [node_ids],
+#   },
+# }
+#
+# rates format: {"torrent_id": rate in KiB/s}
+# ceilings format: {"torrent_id": per-torrent limit in KiB/s}
+#
+# Capacity is handed down the tree from each root. At every node, the
+# capacity is split between direct torrents and child nodes by max-min
+# fairness over their estimated demand, and any spare capacity is then split
+# evenly so that every member has room to grow. Torrents without any limit in
+# their ancestry are left out, so whatever limit they already have stands.
+#
+
+INFINITY = float("inf")
+
+MIN_LIMIT = 0.1
+
+DEMAND_HEADROOM = 1.2
+
+
+def max_min_share(capacity, wants):
+
+  shares = [0.0] * len(wants)
+  pending = sorted(range(len(wants)), key=lambda x: wants[x])
+
+  while pending and capacity > 0.0:
+    fair_share = capacity / len(pending)
+    index = pending[0]
+
+    if wants[index] <= fair_share:
+      shares[index] = wants[index]
+      capacity -= wants[index]
+      pending.pop(0)
+    else:
+      for index in pending:
+        shares[index] = fair_share
+      break
+
+  return shares
+
+
+def waterfill(capacity, demands, ceilings):
+
+  wants = [min(x, y) for x, y in zip(demands, ceilings)]
+  shares = max_min_share(capacity, wants)
+
+  spare = capacity - sum(shares)
+  if spare > 0.0 and shares:
+    room = [y-x for x, y in zip(shares, ceilings)]
+    extra = max_min_share(spare, room)
+    shares = [x+y for x, y in zip(shares, extra)]
+
+  return shares
+
+
+def allocate(nodes, roots, rates, ceilings=None):
+
+  def get_demand(node_id):
+
+    if node_id not in demands:
+      node = nodes[node_id]
+
+      torrent_ids = [x for x in node["torrents"] if x in rates]
+      demand = sum(get_torrent_demand(x) for x in torrent_ids)
+      demand += sum(get_demand(x) for x in node["children"])
+
+      if node["limit"] >= 0.0:
+        demand = min(demand, node["limit"])
+
+      demands[node_id] = demand
+      active[node_id] = bool(torrent_ids) or any(active[x]
+        for x in node["children"])
+
+    return demands[node_id]
+
+
+  def is_active(node_id):
+
+    get_demand(node_id)
+    return active[node_id]
+
+
+  def get_torrent_demand(torrent_id):
+
+    return min(rates[torrent_id]*DEMAND_HEADROOM,
+      ceilings.get(torrent_id, INFINITY))
+
+
+  def get_ceiling(node_id):
+
+    limit = nodes[node_id]["limit"]
+    return limit if limit >= 0.0 else INFINITY
+
+
+  def distribute(node_id, capacity):
+
+    node = nodes[node_id]
+    capacity = min(capacity, get_ceiling(node_id))
+
+    torrent_ids = [x for x in node["torrents"] if x in rates]
+    child_ids = [x for x in node["children"] if is_active(x)]
+
+    if capacity == INFINITY:
+      for id in child_ids:
+        distribute(id, INFINITY)
+
+      return
+
+    member_demands = [get_torrent_demand(x) for x in torrent_ids]
+    member_demands += [get_demand(x) for x in child_ids]
+
+    member_ceilings = [ceilings.get(x, INFINITY) for x in torrent_ids]
+    member_ceilings += [get_ceiling(x) for x in child_ids]
+
+    shares = waterfill(capacity, member_demands, member_ceilings)
+
+    for id, share in zip(torrent_ids, shares):
+      limits[id] = max(share, MIN_LIMIT)
+
+    for id, share in zip(child_ids, shares[len(torrent_ids):]):
+      distribute(id, share)
+
+
+  if ceilings is None:
+    ceilings = {}
+
+  demands = {}
+  active = {}
+  limits = {}
+
+  for id in sorted(roots):
+    distribute(id, INFINITY)
+
+  return limits
+
+
+def get_subtree_rates(nodes, roots, rates):
+
+  def add_rates(node_id):
+
+    node = nodes[node_id]
+
+    total = sum(rates[x] for x in node["torrents"] if x in rates)
+    total += sum(add_rates(x) for x in node["children"])
+
+    sums[node_id] = total
+
+    return total
+
+
+  sums = {}
+
+  for id in roots:
+    add_rates(id)
+
+  return sums
+
+
+def get_unlimited_nodes(nodes, roots):
+
+  def visit(node_id, limited):
+
+    node = nodes[node_id]
+    limited = limited or node["limit"] >= 0.0
+
+    if not limited:
+      unlimited.append(node_id)
+
+    for id in node["children"]:
+      visit(id, limited)
+
+
+  unlimited = []
+
+  for id in roots:
+    visit(id, False)
+
+  return unlimited
@@ -63,6 +63,11 @@ Deluge.plugins.labelplus.DISPLAY_NAME = _('LabelPlus');
 Deluge.plugins.labelplus.STATUS_NAME =
   Deluge.plugins.labelplus.MODULE_NAME + '_name';
 
+Deluge.plugins.labelplus.CHANGED_EVENT = 'LabelPlusChangedEvent';
+
+Deluge.plugins.labelplus.UPDATE_INTERVAL = 1000;
+Deluge.plugins.labelplus.FALLBACK_UPDATE_INTERVAL = 30000;
+
 
 Deluge.plugins.labelplus.util.isReserved = function(id) {
   return (id == 'All' || id == 'None' || id == '');
@@ -91,6 +96,17 @@ Deluge.plugins.labelplus.Plugin = Ext.extend(Deluge.Plugin, {
   },
 
   onDisable: function() {
+    if (this._updateTimer) {
+      clearTimeout(this._updateTimer);
+      delete this._updateTimer;
+    }
+
+    if (this._pushUpdates) {
+      deluge.events.un(Deluge.plugins.labelplus.CHANGED_EVENT,
+        this._onLabelsChanged, this);
+      this._pushUpdates = false;
+    }
+
     if (this._rootMenu) {
       this._rootMenu.destroy();
       delete this._rootMenu;
@@ -148,10 +164,35 @@ Deluge.plugins.labelplus.Plugin = Ext.extend(Deluge.Plugin, {
       this._doUpdate(result);
       this._updateLoop();
 
+      deluge.client.labelplus.get_daemon_info({
+        success: this._checkDaemonInfo,
+        scope: this
+      });
+
       console.log('%s enabled', Deluge.plugins.labelplus.PLUGIN_NAME);
     }
   },
 
+  _checkDaemonInfo: function(info) {
+    if (info && info.change_events) {
+      deluge.events.on(Deluge.plugins.labelplus.CHANGED_EVENT,
+        this._onLabelsChanged, this);
+      this._pushUpdates = true;
+
+      console.log('%s using change events for updates',
+        Deluge.plugins.labelplus.PLUGIN_NAME);
+    }
+  },
+
+  _onLabelsChanged: function(cursor) {
+    if (this._updatePending) {
+      this._refreshRequested = true;
+    } else {
+      clearTimeout(this._updateTimer);
+      this._updateLoop();
+    }
+  },
+
   _doUpdate: function(result) {
     if (!result) {
       return;
@@ -159,6 +200,18 @@ Deluge.plugins.labelplus.Plugin = Ext.extend(Deluge.Plugin, {
 
     this._lastUpdated = result.timestamp;
 
+    if (result.type == 'Delta') {
+      for (var id in result.data) {
+        if (result.data[id] === null) {
+          delete this._labelData[id];
+        } else {
+          this._labelData[id] = result.data[id];
+        }
+      }
+    } else {
+      this._labelData = result.data;
+    }
+
     if (this._rootMenu) {
       this._rootMenu.destroy();
       delete this._rootMenu;
@@ -167,7 +220,7 @@ Deluge.plugins.labelplus.Plugin = Ext.extend(Deluge.Plugin, {
     var menu = new Ext.menu.Menu({ ignoreParentClicks: true });
     menu.add({
       text: _('Set Label'),
-      menu: this._createMenuFromData(result.data)
+      menu: this._createMenuFromData(this._labelData)
     });
 
     this._rootMenu = deluge.menus.torrent.add({
@@ -177,11 +230,27 @@ Deluge.plugins.labelplus.Plugin = Ext.extend(Deluge.Plugin, {
   },
 
   _updateLoop: function() {
-    deluge.client.labelplus.get_label_updates_dict(this._lastUpdated, {
+    delete this._updateTimer;
+    this._updatePending = true;
+
+    deluge.client.labelplus.get_label_updates_dict(this._lastUpdated, true, {
       success: function(result) {
+        this._updatePending = false;
         this._doUpdate(result);
+
+        var interval = this._pushUpdates ?
+          Deluge.plugins.labelplus.FALLBACK_UPDATE_INTERVAL :
+          Deluge.plugins.labelplus.UPDATE_INTERVAL;
+
+        if (this._refreshRequested) {
+          this._refreshRequested = false;
+          interval = 0;
+        }
+
         var self = this;
-        setTimeout(function() { self._updateLoop.apply(self); }, 1000);
+        this._updateTimer = setTimeout(function() {
+          self._updateLoop.apply(self);
+        }, interval);
       },
       scope: this
     });
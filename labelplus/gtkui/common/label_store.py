@@ -34,14 +34,15 @@
 #
 
 
+import bisect
 import copy
+import functools
 import logging
 
 import gobject
 import gtk
 
 import labelplus.common.label
-import labelplus.gtkui.common.gtklib
 
 
 from labelplus.gtkui import RT
@@ -59,6 +60,102 @@ from labelplus.common.literals import (
 log = logging.getLogger(__name__)
 
 
+class DescendentData(dict):
+  # Holds the descendent count, building the id list only when first used
+
+  def __init__(self, count, get_ids):
+
+    super(DescendentData, self).__init__(count=count)
+    self._get_ids = get_ids
+
+
+  def __missing__(self, key):
+
+    if key != "ids":
+      raise KeyError(key)
+
+    self["ids"] = self._get_ids()
+    return self["ids"]
+
+
+class LabelSearchIndex(object):
+  # Case-insensitive prefix and substring search over label full names
+
+  def __init__(self, data):
+
+    entries = []
+
+    for id_ in data:
+      if id_ in RESERVED_IDS:
+        continue
+
+      key = data[id_]["fullname"]
+      if isinstance(key, str):
+        key = key.decode("utf8", "replace")
+
+      entries.append((key.lower(), id_))
+
+    entries.sort()
+
+    self._keys = [x[0] for x in entries]
+    self._ids = [x[1] for x in entries]
+
+    # All keys joined so substring scans run in a single C-level find()
+    self._text = u"\n".join(self._keys)
+    self._offsets = []
+
+    pos = 0
+    for key in self._keys:
+      self._offsets.append(pos)
+      pos += len(key) + 1
+
+
+  def prefix(self, text):
+
+    text = self._normalize(text)
+    if not text:
+      return []
+
+    start = bisect.bisect_left(self._keys, text)
+    end = bisect.bisect_left(self._keys, text + u"\uffff", start)
+
+    return self._ids[start:end]
+
+
+  def search(self, text, limit=-1):
+    # Prefix matches first, in name order, followed by other substring matches
+
+    text = self._normalize(text)
+    if not text:
+      return []
+
+    start = bisect.bisect_left(self._keys, text)
+    end = bisect.bisect_left(self._keys, text + u"\uffff", start)
+
+    results = self._ids[start:end]
+    pos = self._text.find(text)
+
+    while pos != -1 and (limit == -1 or len(results) < limit):
+      i = bisect.bisect_right(self._offsets, pos) - 1
+      if not start <= i < end:
+        results.append(self._ids[i])
+
+      pos = self._text.find(text, self._offsets[i] + len(self._keys[i]) + 1)
+
+    if limit != -1:
+      del results[limit:]
+
+    return results
+
+
+  def _normalize(self, text):
+
+    if isinstance(text, str):
+      text = text.decode("utf8", "replace")
+
+    return text.replace(u"\n", u"").lower()
+
+
 class LabelStore(object):
 
   # Section: Constants
@@ -73,8 +170,11 @@ class LabelStore(object):
 
     self._data = {}
     self._map = {}
+    self._root_ids = []
     self._store = None
     self.model = None
+    self.version = 0
+    self._search_index = None
 
 
   # Section: Deinitialization
@@ -84,6 +184,8 @@ class LabelStore(object):
     self.model = None
     self._store = None
     self._map = {}
+    self._root_ids = []
+    self._search_index = None
     self._data = {}
 
 
@@ -120,8 +222,18 @@ class LabelStore(object):
 
     self._normalize_data(data)
     self._build_fullname_index(data)
-    self._build_store(data)
-    self._build_descendent_data()
+
+    if self._store is None:
+      self._build_store(data)
+      self._build_descendent_data()
+      self._search_index = None
+      self.version += 1
+    else:
+      touched = self._update_store(data)
+      if touched:
+        self._build_descendent_data()
+        self._emit_rows_changed(touched)
+        self.version += 1
 
 
   def get_model_iter(self, id_):
@@ -141,29 +253,41 @@ class LabelStore(object):
     return None
 
 
-  # Section: Public: Label
+  # Section: Public: Search
 
-  def get_descendent_ids(self, id_, max_depth=-1):
+  def get_search_index(self):
+
+    if self._search_index is None:
+      self._search_index = LabelSearchIndex(self._data)
 
-    def add_descendents(iter_, depth):
+    return self._search_index
 
-      if max_depth != -1 and depth > max_depth:
-        return
 
-      children = labelplus.gtkui.common.gtklib.treemodel_get_children(
-        self.model, iter_)
+  def search(self, text, limit=-1):
 
-      for child in children:
-        descendents.append(self.model[child][self.LABEL_ID])
-        add_descendents(child, depth+1)
+    return self.get_search_index().search(text, limit)
 
 
+  # Section: Public: Label
+
+  def get_descendent_ids(self, id_, max_depth=-1):
+
+    if id_ == ID_NULL:
+      children = self._root_ids
+    elif id_ in self._data:
+      children = self._data[id_].get("children", [])
+    else:
+      return []
+
     descendents = []
+    stack = [(x, 1) for x in reversed(children)]
+
+    while stack:
+      id_, depth = stack.pop()
+      descendents.append(id_)
 
-    if id_ == ID_NULL or id_ in self._data:
-      if self.model:
-        iter_ = self.get_model_iter(id_)
-        add_descendents(iter_, 1)
+      if max_depth == -1 or depth < max_depth:
+        stack += ((x, depth+1) for x in reversed(self._data[id_]["children"]))
 
     return descendents
 
@@ -277,14 +401,105 @@ class LabelStore(object):
     self.model = sorted_model
 
 
+  def _update_store(self, data):
+    # Apply differences to the existing store, keeping unchanged rows as is
+
+    removed = set(x for x in self._data if x not in data)
+    added = sorted(x for x in data if x not in self._data)
+    touched = set(removed)
+    touched.update(added)
+
+    if touched:
+      self._search_index = None
+
+    for id_ in removed:
+      parent_id = labelplus.common.label.get_parent_id(id_)
+      if parent_id not in removed:
+        self._store.remove(self._map[id_])
+
+    for id_ in removed:
+      del self._map[id_]
+      del self._data[id_]
+
+    for id_, new_data in data.iteritems():
+      row_data = self._data.get(id_)
+      if row_data is None:
+        continue
+
+      for key, value in new_data.iteritems():
+        if row_data.get(key) != value:
+          if row_data.get("fullname") != new_data.get("fullname"):
+            self._search_index = None
+
+          row_data.update(new_data)
+          touched.add(id_)
+          break
+
+    for id_ in added:
+      if id_ in RESERVED_IDS:
+        parent_id = ID_NULL
+      else:
+        parent_id = labelplus.common.label.get_parent_id(id_)
+
+      parent_iter = self._map.get(parent_id)
+      self._map[id_] = self._store.append(parent_iter, [id_, data[id_]])
+      self._data[id_] = data[id_]
+
+    return touched
+
+
+  def _emit_rows_changed(self, ids):
+    # Refresh changed rows and the ancestors showing their counts
+
+    rows = set()
+
+    for id_ in ids:
+      while id_ and id_ not in rows:
+        if id_ in self._map:
+          rows.add(id_)
+        id_ = labelplus.common.label.get_parent_id(id_)
+
+    for id_ in rows:
+      iter_ = self._map[id_]
+      self._store.row_changed(self._store.get_path(iter_), iter_)
+
+
   def _build_descendent_data(self):
 
-    for id_ in self._data:
-      self._data[id_]["children"] = self.get_descendent_ids(id_, 1)
-      self._data[id_]["descendents"] = {}
+    data = self._data
+    children = dict((x, []) for x in data)
+    root_ids = []
 
-      descendents = self.get_descendent_ids(id_)
+    for id_ in data:
+      if id_ in RESERVED_IDS:
+        parent_id = ID_NULL
+      else:
+        parent_id = labelplus.common.label.get_parent_id(id_)
+
+      if parent_id in children:
+        children[parent_id].append(id_)
+      else:
+        root_ids.append(id_)
+
+    # Post-order walk so that child totals are known before their parent's
+    totals = {}
+
+    for root_id in root_ids:
+      stack = [(root_id, False)]
+
+      while stack:
+        id_, visited = stack.pop()
+
+        if visited:
+          totals[id_] = sum(data[x]["count"] + totals[x]
+            for x in children[id_])
+        else:
+          stack.append((id_, True))
+          stack += ((x, False) for x in children[id_])
+
+    for id_ in data:
+      data[id_]["children"] = children[id_]
+      data[id_]["descendents"] = DescendentData(totals[id_],
+        functools.partial(self.get_descendent_ids, id_))
 
-      self._data[id_]["descendents"]["ids"] = descendents
-      self._data[id_]["descendents"]["count"] = self.get_total_count(
-        descendents)
+    self._root_ids[:] = root_ids
@@ -131,7 +131,7 @@ class LabelOptionsDialog(WidgetEncapsulator):
       "_")
 
     try:
-      self._store = plugin.store.copy()
+      self._store = plugin.store
       self._set_label(ID_NULL)
 
       # Keep window alive with cyclic reference
@@ -171,9 +171,7 @@ class LabelOptionsDialog(WidgetEncapsulator):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   # Section: Public
@@ -189,11 +187,10 @@ class LabelOptionsDialog(WidgetEncapsulator):
       self.destroy()
       return
 
-    self._destroy_store()
-    self._store = store.copy()
+    self._store = store
 
+    # The menu is rebuilt the next time it is opened
     self._destroy_menu()
-    self._create_menu()
 
     self._request_options(self._label_id)
 
@@ -732,8 +729,10 @@ class LabelOptionsDialog(WidgetEncapsulator):
 
   def _do_open_select_menu(self, *args):
 
-    if self._menu:
-      self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
+    if not self._menu:
+      self._create_menu()
+
+    self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
 
 
   def _do_revert_to_defaults(self, widget):
@@ -0,0 +1,191 @@
+#
+# label_search_popup.py
+#
+# Copyright (C) 2014 Ratanak Lun <ratanakvlun@gmail.com>
+#
+# This module is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Linking this software with other modules is making a combined work
+# based on this software. Thus, the terms and conditions of the GNU
+# General Public License cover the whole combination.
+#
+# As a special exception, the copyright holders of this software give
+# you permission to link this software with independent modules to
+# produce a combined work, regardless of the license terms of these
+# independent modules, and to copy and distribute the resulting work
+# under terms of your choice, provided that you also meet, for each
+# linked module in the combined work, the terms and conditions of the
+# license of that module. An independent module is a module which is
+# not derived from or based on this software. If you modify this
+# software, you may extend this exception to your version of the
+# software, but you are not obligated to do so. If you do not wish to
+# do so, delete this exception statement from your version.
+#
+
+
+import gtk
+
+import deluge.component
+
+
+from labelplus.common import _
+from labelplus.gtkui import RT
+
+
+from labelplus.common.literals import TITLE_FIND_LABEL
+
+
+class LabelSearchPopup(gtk.Window):
+
+  # Section: Constants
+
+  MAX_RESULTS = 50
+
+  RESULT_ID = 0
+  RESULT_NAME = 1
+
+
+  # Section: Initialization
+
+  def __init__(self, store, on_select):
+
+    super(LabelSearchPopup, self).__init__(gtk.WINDOW_TOPLEVEL)
+
+    self._store = store
+    self._on_select = on_select
+
+    self.set_title(_(TITLE_FIND_LABEL))
+    self.set_modal(True)
+    self.set_position(gtk.WIN_POS_CENTER_ON_PARENT)
+    self.set_default_size(360, 320)
+
+    self._entry = gtk.Entry()
+    self._results = gtk.ListStore(str, str)
+    self._view = gtk.TreeView(self._results)
+
+    if __debug__: RT.register(self._results, __name__)
+
+    self._build_widgets()
+    self._register_handlers()
+
+
+  @classmethod
+  def open(cls, store, on_select, parent=None):
+    # Show a popup over parent, or the main window, that calls on_select
+    # with the chosen label id
+
+    popup = cls(store, on_select)
+    if __debug__: RT.register(popup, __name__)
+
+    popup.set_transient_for(parent or
+      deluge.component.get("MainWindow").window)
+    popup.show_all()
+    popup._entry.grab_focus()
+
+    return popup
+
+
+  def _build_widgets(self):
+
+    column = gtk.TreeViewColumn(None, gtk.CellRendererText(),
+      text=self.RESULT_NAME)
+    self._view.append_column(column)
+    self._view.set_headers_visible(False)
+    self._view.set_enable_search(False)
+
+    scroll = gtk.ScrolledWindow()
+    scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+    scroll.set_shadow_type(gtk.SHADOW_IN)
+    scroll.add(self._view)
+
+    box = gtk.VBox(spacing=6)
+    box.set_border_width(6)
+    box.pack_start(self._entry, expand=False)
+    box.pack_start(scroll)
+
+    self.add(box)
+
+
+  def _register_handlers(self):
+
+    self._entry.connect("changed", self._on_entry_changed)
+    self._entry.connect("activate", self._on_entry_activate)
+    self._view.connect("row-activated", self._on_row_activated)
+    self.connect("key-press-event", self._on_key_press)
+
+
+  # Section: General
+
+  def _update_results(self, text):
+
+    self._results.clear()
+
+    for id_ in self._store.search(text, self.MAX_RESULTS):
+      self._results.append([id_, self._store[id_]["fullname"]])
+
+    if len(self._results):
+      self._view.set_cursor((0,))
+
+
+  def _move_cursor(self, step):
+
+    count = len(self._results)
+    if not count:
+      return
+
+    path, column = self._view.get_cursor()
+    row = path[0] + step if path else 0
+    self._view.set_cursor((min(max(row, 0), count-1),))
+
+
+  def _select(self, path):
+
+    id_ = self._results[path][self.RESULT_ID]
+    self.destroy()
+    self._on_select(id_)
+
+
+  # Section: Handlers
+
+  def _on_entry_changed(self, widget):
+
+    self._update_results(widget.get_text())
+
+
+  def _on_entry_activate(self, widget):
+
+    path, column = self._view.get_cursor()
+    if path:
+      self._select(path)
+
+
+  def _on_row_activated(self, widget, path, column):
+
+    self._select(path)
+
+
+  def _on_key_press(self, widget, event):
+
+    key = gtk.gdk.keyval_name(event.keyval)
+
+    if key == "Escape":
+      self.destroy()
+    elif key == "Up":
+      self._move_cursor(-1)
+    elif key == "Down":
+      self._move_cursor(1)
+    else:
+      return False
+
+    return True
@@ -56,18 +56,21 @@ class LabelSelectionMenu(gtk.Menu):
 
     self.has_user_labels = False
 
-    self._items = []
-    self._menus = []
+    self._model = model
+    self._on_activate = on_activate
+    self._headers = headers
+    self._sub_items = sub_items
 
-    self._build_menu(model, on_activate, headers, root_items, sub_items)
-    self.show_all()
+    # Submenus are filled in when first selected: {submenu: row reference}
+    self._unbuilt = {}
 
-    del self._items
-    del self._menus
+    self._build_menu(root_items)
+    self.show_all()
 
 
-  def _build_menu(self, model, on_activate, headers, root_items, sub_items):
+  def _build_menu(self, root_items):
 
+    model = self._model
     children = labelplus.gtkui.common.gtklib.treemodel_get_children(model)
 
     for child in list(children):
@@ -79,55 +82,65 @@ class LabelSelectionMenu(gtk.Menu):
       self.has_user_labels = True
 
     if root_items:
-      self._items += labelplus.gtkui.common.gtklib.menu_add_items(self, -1,
-        root_items)
+      labelplus.gtkui.common.gtklib.menu_add_items(self, -1, root_items)
       if children:
-        self._items.append(labelplus.gtkui.common.gtklib.menu_add_separator(
-          self))
+        labelplus.gtkui.common.gtklib.menu_add_separator(self)
 
     for child in children:
-      self._create_item(model, child, self, on_activate, headers, sub_items)
+      self._create_item(child, self)
 
 
-  def _create_item(self, model, iter_, menu, on_activate, headers, sub_items):
+  def _create_item(self, iter_, menu):
 
-    id_, data = model[iter_]
+    id_, data = self._model[iter_]
     name = data["name"]
 
     item = gtk.MenuItem(name)
     item.set_name(id_)
     menu.append(item)
-    self._items.append(item)
     if __debug__: RT.register(item, __name__)
 
-    children = labelplus.gtkui.common.gtklib.treemodel_get_children(model,
-      iter_)
-
-    if not children and not sub_items:
-      if on_activate:
-        item.connect("activate", on_activate, id_)
+    if not self._model.iter_has_child(iter_) and not self._sub_items:
+      if self._on_activate:
+        item.connect("activate", self._on_activate, id_)
     else:
       submenu = gtk.Menu()
       item.set_submenu(submenu)
-      self._menus.append(submenu)
+      item.connect("select", self._on_select_item)
       if __debug__: RT.register(submenu, __name__)
 
-      if headers:
-        self._items += labelplus.gtkui.common.gtklib.menu_add_items(submenu,
-          -1, (((gtk.MenuItem, name), on_activate, id_),))
-        self._items.append(labelplus.gtkui.common.gtklib.menu_add_separator(
-          submenu))
+      self._unbuilt[submenu] = gtk.TreeRowReference(self._model,
+        self._model.get_path(iter_))
+
+
+  def _build_submenu(self, submenu):
+
+    row = self._unbuilt.pop(submenu, None)
+    if not row or not row.valid():
+      return
+
+    model = self._model
+    iter_ = model.get_iter(row.get_path())
+    id_, data = model[iter_]
+
+    children = labelplus.gtkui.common.gtklib.treemodel_get_children(model,
+      iter_)
+
+    if self._headers:
+      labelplus.gtkui.common.gtklib.menu_add_items(submenu, -1,
+        (((gtk.MenuItem, data["name"]), self._on_activate, id_),))
+      labelplus.gtkui.common.gtklib.menu_add_separator(submenu)
 
-      if sub_items:
-        self._items += labelplus.gtkui.common.gtklib.menu_add_items(submenu,
-          -1, sub_items, id_)
-        if children:
-          self._items.append(labelplus.gtkui.common.gtklib.menu_add_separator(
-            submenu))
+    if self._sub_items:
+      labelplus.gtkui.common.gtklib.menu_add_items(submenu, -1,
+        self._sub_items, id_)
+      if children:
+        labelplus.gtkui.common.gtklib.menu_add_separator(submenu)
 
-      for child in children:
-        self._create_item(model, child, submenu, on_activate, headers,
-          sub_items)
+    for child in children:
+      self._create_item(child, submenu)
+
+    submenu.show_all()
 
 
   # Section: Public
@@ -145,6 +158,7 @@ class LabelSelectionMenu(gtk.Menu):
         if id_.startswith(name + ":"):
           submenu = child.get_submenu()
           if submenu:
+            self._build_submenu(submenu)
             return find_item(submenu)
           else:
             return None
@@ -153,3 +167,10 @@ class LabelSelectionMenu(gtk.Menu):
 
 
     return find_item(self)
+
+
+  # Section: Handlers
+
+  def _on_select_item(self, item):
+
+    self._build_submenu(item.get_submenu())
@@ -122,7 +122,7 @@ class NameInputDialog(WidgetEncapsulator):
       "_")
 
     try:
-      self._store = plugin.store.copy()
+      self._store = plugin.store
       self._set_parent_label(self._parent_id)
 
       # Keep window alive with cyclic reference
@@ -160,9 +160,7 @@ class NameInputDialog(WidgetEncapsulator):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   # Section: Public
@@ -179,11 +177,10 @@ class NameInputDialog(WidgetEncapsulator):
         self.destroy()
         return
 
-    self._destroy_store()
-    self._store = store.copy()
+    self._store = store
 
+    # The menu is rebuilt the next time it is opened
     self._destroy_menu()
-    self._create_menu()
 
     self._select_parent_label(self._parent_id)
 
@@ -386,8 +383,10 @@ class NameInputDialog(WidgetEncapsulator):
 
   def _do_open_select_menu(self, *args):
 
-    if self._menu:
-      self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
+    if not self._menu:
+      self._create_menu()
+
+    self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
 
 
   def _do_toggle_fullname(self, *args):
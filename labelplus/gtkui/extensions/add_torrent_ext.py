@@ -51,6 +51,9 @@ from labelplus.common import LabelPlusError
 from labelplus.gtkui.common.widgets.label_selection_menu import (
   LabelSelectionMenu)
 
+from labelplus.gtkui.common.widgets.label_search_popup import (
+  LabelSearchPopup)
+
 from labelplus.gtkui.common.gtklib.widget_encapsulator import (
   WidgetEncapsulator)
 
@@ -62,6 +65,8 @@ from labelplus.common.label import (
 )
 
 from labelplus.common.literals import (
+  TITLE_FIND_LABEL,
+
   STR_NONE,
   ERR_INVALID_LABEL,
 )
@@ -97,8 +102,7 @@ class AddTorrentExt(WidgetEncapsulator):
     super(AddTorrentExt, self).__init__(self.GLADE_FILE, self.ROOT_WIDGET, "_")
 
     try:
-      self._store = plugin.store.copy()
-      if __debug__: RT.register(self._store, __name__)
+      self._store = plugin.store
 
       log.debug("Setting up widgets...")
       self._setup_widgets()
@@ -111,9 +115,6 @@ class AddTorrentExt(WidgetEncapsulator):
       self._display_torrent_label(None)
       self._update_sensitivity()
 
-      log.debug("Creating menu...")
-      self._create_menu()
-
       self._plugin.register_update_func(self.update_store)
     except:
       self.unload()
@@ -124,8 +125,10 @@ class AddTorrentExt(WidgetEncapsulator):
 
     def on_click(widget):
 
-      if self._menu:
-        self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
+      if not self._menu:
+        self._create_menu()
+
+      self._menu.popup(None, None, None, 1, gtk.gdk.CURRENT_TIME)
 
 
     def on_toggle(widget):
@@ -184,7 +187,16 @@ class AddTorrentExt(WidgetEncapsulator):
         self._display_torrent_label(id)
 
 
-    items = (((gtk.MenuItem, _(STR_NONE)), on_activate, ID_NONE),)
+    def on_find(widget):
+
+      LabelSearchPopup.open(self._store,
+        lambda label_id: on_activate(None, label_id), self._dialog.dialog)
+
+
+    items = (
+      ((gtk.MenuItem, _(STR_NONE)), on_activate, ID_NONE),
+      ((gtk.MenuItem, "%s..." % _(TITLE_FIND_LABEL)), on_find),
+    )
 
     self._menu = LabelSelectionMenu(self._store.model, on_activate,
       root_items=items)
@@ -229,9 +241,7 @@ class AddTorrentExt(WidgetEncapsulator):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   # Section: General
@@ -255,12 +265,10 @@ class AddTorrentExt(WidgetEncapsulator):
 
   def update_store(self, store):
 
-    self._store.destroy()
-    self._store = store.copy()
-    if __debug__: RT.register(self._store, __name__)
+    self._store = store
 
+    # The menu is rebuilt the next time it is opened
     self._destroy_menu()
-    self._create_menu()
 
     self._refresh_torrent_label()
 
@@ -52,6 +52,9 @@ from labelplus.gtkui.common.gtklib import ImageMenuItem
 from labelplus.gtkui.common.widgets.name_input_dialog import AddLabelDialog
 from labelplus.gtkui.common.widgets.name_input_dialog import RenameLabelDialog
 
+from labelplus.gtkui.common.widgets.label_search_popup import (
+  LabelSearchPopup)
+
 from labelplus.gtkui.common.widgets.label_options_dialog import (
   LabelOptionsDialog)
 
@@ -99,8 +102,7 @@ class SidebarExt(object):
     self._handlers = []
 
     try:
-      self._store = plugin.store.copy()
-      if __debug__: RT.register(self._store, __name__)
+      self._store = plugin.store
 
       log.debug("Setting up widgets...")
       self._create_label_tree()
@@ -157,9 +159,7 @@ class SidebarExt(object):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   # Section: Public
@@ -214,9 +214,11 @@ class SidebarExt(object):
       adj.set_value(value)
 
 
-    self._store.destroy()
-    self._store = store.copy()
-    if __debug__: RT.register(self._store, __name__)
+    self._store = store
+
+    if store.model is self._tree.get_model():
+      # Rows are updated in place, so the view is already current
+      return
 
     value = self._tree.parent.get_vadjustment().get_value()
     gobject.idle_add(restore_adjustment, value)
@@ -309,9 +311,18 @@ class SidebarExt(object):
 
       id, data = model[iter]
 
-      if data["fullname"].lower().startswith(key.lower()):
+      # Look up the matches once per key instead of once per row
+      if search_cache["key"] != (key, self._store.version):
+        search_cache["key"] = (key, self._store.version)
+        search_cache["ids"] = set(self._store.get_search_index().prefix(key))
+
+      if id in search_cache["ids"]:
         return False
 
+      if id in RESERVED_IDS:
+        if data["fullname"].lower().startswith(key.lower()):
+          return False
+
       if key.endswith("/"):
         if data["fullname"].lower() == key[:-1].lower():
           self._tree.expand_to_path(model.get_path(iter))
@@ -319,6 +330,8 @@ class SidebarExt(object):
       return True
 
 
+    search_cache = {"key": None, "ids": set()}
+
     tree = gtk.TreeView()
     column = gtk.TreeViewColumn(DISPLAY_NAME)
     renderer = gtk.CellRendererText()
@@ -433,6 +446,11 @@ class SidebarExt(object):
         pass
 
 
+    def on_find(widget):
+
+      LabelSearchPopup.open(self._store, lambda id: self.select_labels([id]))
+
+
     def on_show_menu(widget):
 
       self._menu.show_all()
@@ -454,6 +472,8 @@ class SidebarExt(object):
       ((ImageMenuItem, gtk.STOCK_REMOVE, _("_Remove Label")), on_remove),
       ((gtk.SeparatorMenuItem,),),
       ((ImageMenuItem, gtk.STOCK_PREFERENCES, _("Label _Options")), on_option),
+      ((gtk.SeparatorMenuItem,),),
+      ((ImageMenuItem, gtk.STOCK_FIND, _("_Find Label...")), on_find),
     ))
 
     self._menu = menu
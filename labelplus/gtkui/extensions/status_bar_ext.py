@@ -75,8 +75,6 @@ UPLOAD_RATE = 1
 
 log = logging.getLogger(__name__)
 
-from labelplus.gtkui import RT
-
 
 class StatusBarExt(object):
 
@@ -94,8 +92,7 @@ class StatusBarExt(object):
     self._calls = []
 
     try:
-      self._store = plugin.store.copy()
-      if __debug__: RT.register(self._store, __name__)
+      self._store = plugin.store
 
       log.debug("Installing widgets...")
       self._install_status_item()
@@ -123,18 +120,14 @@ class StatusBarExt(object):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   # Section: Public: Update
 
   def update_store(self, store):
 
-    self._store.destroy()
-    self._store = store.copy()
-    if __debug__: RT.register(self._store, __name__)
+    self._store = store
 
 
   # Section: Status Bar
@@ -54,6 +54,9 @@ from labelplus.gtkui.common.widgets.label_options_dialog import (
 from labelplus.gtkui.common.widgets.label_selection_menu import (
   LabelSelectionMenu)
 
+from labelplus.gtkui.common.widgets.label_search_popup import (
+  LabelSearchPopup)
+
 from labelplus.gtkui.common.gtklib.dnd import TreeViewDragSourceProxy
 from labelplus.gtkui.common.gtklib.dnd import DragTarget
 
@@ -61,7 +64,7 @@ from labelplus.gtkui.common.gtklib.dnd import DragTarget
 from labelplus.common import (
   DISPLAY_NAME,
 
-  STATUS_NAME, STATUS_ID,
+  STATUS_NAME, STATUS_ID, FILTER_TREE_ID,
 )
 
 from labelplus.common.label import (
@@ -69,7 +72,7 @@ from labelplus.common.label import (
 )
 
 from labelplus.common.literals import (
-  TITLE_SET_FILTER, TITLE_SET_LABEL, TITLE_LABEL_OPTIONS,
+  TITLE_SET_FILTER, TITLE_SET_LABEL, TITLE_LABEL_OPTIONS, TITLE_FIND_LABEL,
 
   STR_ALL, STR_NONE, STR_PARENT, STR_SELECTED,
 )
@@ -97,14 +100,14 @@ class TorrentViewExt(object):
     self._submenus = []
 
     self._alt_menu = None
+    self._menus_stale = False
 
     self._dnd_src_proxy = None
 
     self._handlers = []
 
     try:
-      self._store = plugin.store.copy()
-      if __debug__: RT.register(self._store, __name__)
+      self._store = plugin.store
 
       log.debug("Installing widgets...")
       self._add_column()
@@ -161,6 +164,8 @@ class TorrentViewExt(object):
 
     self._register_handler(self._view.treeview, "button-press-event",
       self._on_view_button_press)
+    self._register_handler(self._menubar.torrentmenu, "show",
+      self._on_torrent_menu_show)
 
 
   # Section: Deinitialization
@@ -218,14 +223,13 @@ class TorrentViewExt(object):
 
   def _destroy_store(self):
 
-    if self._store:
-      self._store.destroy()
-      self._store = None
+    self._store = None
 
 
   def _reset_filter(self):
 
-    if self._view.filter and self._view.filter.get(STATUS_ID) is not None:
+    if self._view.filter and (self._view.filter.get(STATUS_ID) is not None or
+        self._view.filter.get(FILTER_TREE_ID) is not None):
       self._view.set_filter({})
 
 
@@ -250,7 +254,11 @@ class TorrentViewExt(object):
       filter = {}
     else:
       if self._plugin.config["common"]["filter_include_sublabels"]:
-        filter = {STATUS_ID: self._get_full_family(ids)}
+        if self._plugin.daemon_info.get("tree_filter"):
+          filter = {FILTER_TREE_ID:
+            labelplus.common.label.get_base_ancestors(ids)}
+        else:
+          filter = {STATUS_ID: self._get_full_family(ids)}
       else:
         filter = {STATUS_ID: ids}
 
@@ -263,6 +271,14 @@ class TorrentViewExt(object):
     if ID_ALL in ids and len(self._view.filter) == 0:
       return True
 
+    if FILTER_TREE_ID in self._view.filter:
+      if not self._plugin.config["common"]["filter_include_sublabels"]:
+        return False
+
+      label_ids = self._view.filter[FILTER_TREE_ID]
+      if set(labelplus.common.label.get_base_ancestors(ids)) == set(label_ids):
+        return True
+
     if STATUS_ID in self._view.filter:
       label_ids = self._view.filter[STATUS_ID]
 
@@ -306,9 +322,18 @@ class TorrentViewExt(object):
 
   def update_store(self, store):
 
-    self._store.destroy()
-    self._store = store.copy()
-    if __debug__: RT.register(self._store, __name__)
+    self._store = store
+
+    # Menus are rebuilt the next time one of them is shown
+    self._menus_stale = True
+
+
+  def _refresh_menus(self):
+
+    if not self._menus_stale:
+      return
+
+    self._menus_stale = False
 
     self._destroy_alternate_menu()
     self._alt_menu = self._create_alternate_menu()
@@ -459,6 +484,11 @@ class TorrentViewExt(object):
       on_activate(widget, ids)
 
 
+    def on_find(widget):
+
+      LabelSearchPopup.open(self._store, lambda id: on_activate(None, id))
+
+
     def on_show_menu(widget):
 
       items[0].hide()
@@ -487,6 +517,7 @@ class TorrentViewExt(object):
       (
         ((gtk.MenuItem, _(STR_PARENT)), on_activate_parent),
         ((gtk.MenuItem, _(STR_SELECTED)), on_activate_selected),
+        ((gtk.MenuItem, "%s..." % _(TITLE_FIND_LABEL)), on_find),
       )
     )
 
@@ -519,6 +550,11 @@ class TorrentViewExt(object):
       on_activate(widget, parent_id)
 
 
+    def on_find(widget):
+
+      LabelSearchPopup.open(self._store, lambda id: on_activate(None, id))
+
+
     def on_show_menu(widget):
 
       items[0].hide()
@@ -536,7 +572,11 @@ class TorrentViewExt(object):
     menu.connect("show", on_show_menu)
 
     items = labelplus.gtkui.common.gtklib.menu_add_items(menu, 1,
-      (((gtk.MenuItem, _(STR_PARENT)), on_activate_parent),))
+      (
+        ((gtk.MenuItem, _(STR_PARENT)), on_activate_parent),
+        ((gtk.MenuItem, "%s..." % _(TITLE_FIND_LABEL)), on_find),
+      )
+    )
 
     root = gtk.MenuItem(_(TITLE_SET_LABEL))
     root.set_submenu(menu)
@@ -640,6 +680,11 @@ class TorrentViewExt(object):
 
   # Section: Deluge Handlers
 
+  def _on_torrent_menu_show(self, widget):
+
+    self._refresh_menus()
+
+
   def _on_view_button_press(self, widget, event):
 
     x, y = event.get_coords()
@@ -647,6 +692,7 @@ class TorrentViewExt(object):
     if not path_info:
       self._view.treeview.get_selection().unselect_all()
       if event.button == 3:
+        self._refresh_menus()
         self._alt_menu.popup(None, None, None, event.button, event.time)
       return
 
@@ -58,6 +58,7 @@ from deluge.ui.client import client
 from deluge.ui.client import DelugeRPCError
 from deluge.plugins.pluginbase import GtkPluginBase
 
+from labelplus.common import LabelUpdate
 from labelplus.common import LabelPlusError
 from labelplus.gtkui.common.label_store import LabelStore
 from labelplus.gtkui.extensions.add_torrent_ext import AddTorrentExt
@@ -77,6 +78,7 @@ GTKUI_CONFIG = "%s_ui.conf" % labelplus.common.MODULE_NAME
 
 INIT_POLLING_INTERVAL = 3.0
 UPDATE_INTERVAL = 1.0
+FALLBACK_UPDATE_INTERVAL = 30.0
 
 THROTTLED_INTERVAL = 6.0
 MAX_TRIES = 10
@@ -116,6 +118,12 @@ class GtkUI(GtkPluginBase):
     self._tries = 0
     self._calls = []
 
+    self.daemon_info = {}
+
+    self._push_updates = False
+    self._update_pending = False
+    self._refresh_requested = False
+
     self._extensions = []
 
     self._update_funcs = []
@@ -165,9 +173,26 @@ class GtkUI(GtkPluginBase):
       log.error("Error initializing %s", self.__class__.__name__)
       raise
 
+    client.labelplus.get_daemon_info().addCallback(self._check_daemon_info)
+
     twisted.internet.reactor.callLater(0, self._update_loop)
 
 
+  def _check_daemon_info(self, info):
+
+    if not self.initialized:
+      return
+
+    self.daemon_info = info or {}
+
+    if self.daemon_info.get("change_events"):
+      client.register_event_handler("LabelPlusChangedEvent",
+        self._on_labels_changed)
+      self._push_updates = True
+
+      log.debug("Using change events for updates")
+
+
   def _load_extensions(self):
 
     log.info("Loading extensions...")
@@ -191,6 +216,11 @@ class GtkUI(GtkPluginBase):
 
     labelplus.common.cancel_calls(self._calls)
 
+    if self._push_updates:
+      client.deregister_event_handler("LabelPlusChangedEvent",
+        self._on_labels_changed)
+      self._push_updates = False
+
     self._run_cleanup_funcs()
     self._unload_extensions()
     self._update_funcs = []
@@ -342,6 +372,8 @@ class GtkUI(GtkPluginBase):
 
       log.error("%s: %s", STR_UPDATE, LabelPlusError(ERR_TIMED_OUT))
 
+      self._update_pending = False
+
       if self.initialized:
         self._tries += 1
         if self._tries < MAX_TRIES:
@@ -353,6 +385,8 @@ class GtkUI(GtkPluginBase):
 
     def process_result(result):
 
+      self._update_pending = False
+
       if isinstance(result, Failure):
         if (isinstance(result.value, DelugeRPCError) and
             result.value.exception_type == "LabelPlusError"):
@@ -363,9 +397,17 @@ class GtkUI(GtkPluginBase):
           return result
       else:
         self._tries = 0
-        interval = UPDATE_INTERVAL
         self._update_store(result)
 
+        if self._refresh_requested:
+          interval = 0
+        elif self._push_updates:
+          interval = FALLBACK_UPDATE_INTERVAL
+        else:
+          interval = UPDATE_INTERVAL
+
+      self._refresh_requested = False
+
       if self.initialized:
         self._calls.append(twisted.internet.reactor.callLater(interval,
           self._update_loop))
@@ -374,12 +416,32 @@ class GtkUI(GtkPluginBase):
     labelplus.common.clean_calls(self._calls)
 
     if self.initialized:
+      self._update_pending = True
+
       pickled_time = cPickle.dumps(self.last_updated)
-      deferred = client.labelplus.get_label_updates(pickled_time)
+      if self.daemon_info.get("delta_updates"):
+        deferred = client.labelplus.get_label_updates(pickled_time, True)
+      else:
+        deferred = client.labelplus.get_label_updates(pickled_time)
       labelplus.common.deferred_timeout(deferred, REQUEST_TIMEOUT, on_timeout,
         process_result, process_result)
 
 
+  def _on_labels_changed(self, cursor):
+
+    if not self.initialized:
+      return
+
+    if self.last_updated and cPickle.loads(cursor) < self.last_updated:
+      return
+
+    if self._update_pending:
+      self._refresh_requested = True
+    else:
+      labelplus.common.cancel_calls(self._calls)
+      self._update_loop()
+
+
   def _update_store(self, result):
 
     if not result:
@@ -390,11 +452,40 @@ class GtkUI(GtkPluginBase):
     log.debug("Update: Type: %s, Timestamp: %s", update.type,
       update.timestamp)
 
+    if update.type == LabelUpdate.TYPE_DELTA:
+      data = self._merge_update_data(update.data)
+    else:
+      data = update.data
+
     self.last_updated = update.timestamp
-    self.store.update(update.data)
+
+    # Extensions share the store, so they only need telling when it changed
+    version = self.store.version
+    self.store.update(data)
+    if self.store.version == version:
+      return
 
     for func in list(self._update_funcs):
       try:
         func(self.store)
       except:
         log.exception("Failed to run %s()", func.func_name)
+
+
+  def _merge_update_data(self, delta):
+
+    data = {}
+
+    for id in self.store:
+      data[id] = {
+        "name": self.store[id]["name"],
+        "count": self.store[id]["count"],
+      }
+
+    for id in delta:
+      if delta[id] is None:
+        data.pop(id, None)
+      else:
+        data[id] = delta[id]
+
+    return data